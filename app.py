@@ -1,8 +1,10 @@
 # app.py
 import streamlit as st
 import os
-from gdrive_storage import google_drive_login
-from data_utils import load_all_data, save_all_data, load_settings, save_settings
+from storage_backend import get_backend, StorageError
+from data_utils import open_tables, load_settings, save_settings
+from repository import Repository
+from invoice_commit import finish_journal
 from ui_company import company_tab
 from ui_customers import customers_tab
 from ui_products import products_tab
@@ -12,14 +14,32 @@ from ui_reports import reports_tab
 
 st.set_page_config(page_title="MOOFU's Billing APP", page_icon= "🌿", layout="wide")
 
-# Google Drive authentication - REQUIRED
-if not google_drive_login():
+storage = get_backend()
+
+# Storage authentication (Google Drive login) - REQUIRED
+if not storage.login():
     st.info("👈 Please login with Google Drive from the sidebar to continue")
     st.stop()
     
-# Load data with progress indicator
-with st.spinner("Loading data from Google Drive..."):
-    customers, products, bills, items_df, company_df, settings_df, batches_df, stock_movements_df = load_all_data()
+def load_failed(e):
+    """Stop the run after a failed read rather than showing (and later saving) empty tables"""
+    st.error(f"⚠️ Could not load data from {storage.label}: {e}")
+    storage.status_sidebar()
+    if st.button("🔁 Retry", key="retry_load_btn"):
+        st.rerun()
+    st.stop()
+
+# Tables are loaded the first time a tab uses them; the first paint only
+# needs settings and company details
+try:
+    with st.spinner(f"Loading data from {storage.label}..."):
+        repo = Repository(open_tables())
+        settings_df = repo['settings.csv']
+        repo['company.csv']
+        # An invoice whose save was cut short is finished before anything else
+        finish_journal(repo)
+except StorageError as e:
+    load_failed(e)
 
 # # app.py
 # import streamlit as st
@@ -90,43 +110,56 @@ if upi_id != saved_upi_id and not logo_file:
     save_settings(logo_path, upi_id)
 
 # Tabs - Added Stock Management
+# Only the open tab runs, so only the tables it uses are loaded
 tab1, tab2, tab3, tab4, tab5, tab6, tab7, tab8 = st.tabs([
     "🏢 Company","👥 Customers","📦 Products","📊 Stock & Batches",
     "🧾 Create Bill","👁️ View Bill","✏️ Edit Bill","📈 Reports"
-])
+], key="main_tabs", on_change="rerun")
 
-with tab1:
-    company_df = company_tab(company_df)
+try:
+    if tab1.open:
+        with tab1:
+            company_tab(repo)
 
-with tab2:
-    customers = customers_tab(customers)
+    if tab2.open:
+        with tab2:
+            customers_tab(repo)
 
-with tab3:
-    products = products_tab(products)
+    if tab3.open:
+        with tab3:
+            products_tab(repo)
 
-with tab4:
-    products, batches_df, stock_movements_df = stock_management_tab(products, batches_df, stock_movements_df)
+    if tab4.open:
+        with tab4:
+            stock_management_tab(repo)
 
-with tab5:
-    # FIXED: Pass all required arguments including batches_df, stock_movements_df, logo_path, upi_id
-    customers, products, bills, items_df, company_df, batches_df, stock_movements_df = create_bill_tab(
-        customers, products, bills, items_df, company_df, batches_df, stock_movements_df, logo_path, upi_id
-    )
+    if tab5.open:
+        with tab5:
+            create_bill_tab(repo, logo_path, upi_id)
 
-with tab6:
-    view_bill_tab(bills, items_df, customers)
+    if tab6.open:
+        with tab6:
+            view_bill_tab(repo)
 
-with tab7:
-    # FIXED: Pass all required arguments
-    bills, items_df, products, batches_df, stock_movements_df = edit_bill_tab(
-        bills, items_df, customers, products, company_df, batches_df, stock_movements_df, logo_path, upi_id
-    )
+    if tab7.open:
+        with tab7:
+            edit_bill_tab(repo, logo_path, upi_id)
 
-with tab8:
-    reports_tab(bills, items_df, customers)
+    if tab8.open:
+        with tab8:
+            reports_tab(repo)
+except StorageError as e:
+    load_failed(e)
 
 # Save all data including batches and stock movements
-save_all_data(customers, products, bills, items_df, company_df, batches_df, stock_movements_df)
+repo.save()
+
+download_timings = storage.load_timings()
+if download_timings:
+    with st.sidebar.expander("⏱️ Load timings"):
+        for filename, seconds in sorted(download_timings.items(), key=lambda t: t[1], reverse=True):
+            st.caption(f"{filename}: {seconds:.2f}s")
+storage.status_sidebar()
 
 # Footer
 st.divider()
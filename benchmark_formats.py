@@ -0,0 +1,68 @@
+# benchmark_formats.py - compare table storage formats on synthetic data
+# Usage: python benchmark_formats.py [rows]
+import sys
+import time
+import numpy as np
+import pandas as pd
+from storage_formats import FORMATS, format_available, serialize, deserialize
+
+
+def make_bill_items(rows):
+    """Synthetic bill_items table shaped like the real one"""
+    rng = np.random.default_rng(0)
+    return pd.DataFrame({
+        'bill_no': [f"INV/2025-2026/{n // 8 + 1}" for n in range(rows)],
+        'product': rng.choice([f"Product {n}" for n in range(500)], rows),
+        'qty': rng.integers(1, 50, rows),
+        'price': rng.uniform(10, 2000, rows).round(2),
+        'gst': rng.choice([0.0, 5.0, 12.0, 18.0], rows),
+        'mfg': '01/04/2025',
+        'exp': '31/03/2026',
+        'free': rng.integers(0, 3, rows),
+        'discount': rng.choice([0.0, 2.5, 5.0], rows),
+        'batch_no': rng.choice([f"B{n:04d}" for n in range(200)], rows),
+    })
+
+
+def make_stock_movements(rows):
+    """Synthetic stock_movements table shaped like the real one"""
+    rng = np.random.default_rng(1)
+    return pd.DataFrame({
+        'id': np.arange(1, rows + 1),
+        'product_id': rng.integers(1, 500, rows),
+        'batch_no': rng.choice([f"B{n:04d}" for n in range(200)], rows),
+        'movement_type': rng.choice(['IN', 'OUT', 'ADJUST_IN', 'ADJUST_OUT'], rows),
+        'quantity': rng.integers(-50, 50, rows),
+        'date': pd.date_range('2023-04-01', periods=rows, freq='min').strftime('%Y-%m-%d'),
+        'reference': [f"INV/2025-2026/{n // 8 + 1}" for n in range(rows)],
+        'notes': 'Sale',
+    })
+
+
+def timed(func, repeat=3):
+    """Best wall time of func over a few runs, with its last result"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def benchmark(name, df):
+    print(f"\n{name}: {len(df):,} rows")
+    print(f"{'format':<10}{'size KB':>12}{'write ms':>12}{'read ms':>12}")
+    for fmt, spec in FORMATS.items():
+        if not format_available(fmt):
+            print(f"{fmt:<10}{'(needs ' + spec['needs'] + ')':>36}")
+            continue
+        stored = 'table' + spec['ext']
+        write_s, data = timed(lambda: serialize(df, stored))
+        read_s, _ = timed(lambda: deserialize(data, stored))
+        print(f"{fmt:<10}{len(data) / 1024:>12,.1f}{write_s * 1000:>12.1f}{read_s * 1000:>12.1f}")
+
+
+if __name__ == "__main__":
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    benchmark("bill_items", make_bill_items(rows))
+    benchmark("stock_movements", make_stock_movements(rows))
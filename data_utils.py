@@ -1,9 +1,15 @@
 
 # data_utils.py
 import os
+import re
+import hashlib
 import pandas as pd
-from datetime import date, datetime
-from gdrive_storage import upload_csv_to_drive, download_csv_from_drive
+from datetime import date
+from functools import partial
+from storage_backend import get_backend
+from storage_formats import FORMATS, split_ext, stored_name
+from table_schema import TABLE_SCHEMAS, apply_schema, table_columns
+from invoice_sequence import InvoiceSequence
 import streamlit as st
 
 DATA_DIR = "data"
@@ -17,17 +23,19 @@ def financial_year():
     y = date.today().year
     return f"{y}-{y+1}" if date.today().month > 3 else f"{y-1}-{y}"
 
-def next_invoice_no(bills):
-    fy = financial_year()
-    if bills.empty:
-        count = 1
-    else:
-        count = len(bills[bills.fy == fy]) + 1
-    return f"INV/{fy}/{count}"
+def invoice_sequence(bills, fy=None):
+    """Invoice numbers of a financial year (this one by default), kept in a storage counter"""
+    sequence = InvoiceSequence(get_backend(), fy or financial_year())
+    sequence.start_after(bills)
+    return sequence
+
+def audit_invoice_numbers(bills, fy):
+    """(numbers skipped, invoice numbers used twice) among a financial year's bills"""
+    return InvoiceSequence(get_backend(), fy).audit(bills)
 
 def get_month_year_folder(bill_date, customer_name):
     """Create folder path based on customer and month/year"""
-    dt = datetime.strptime(str(bill_date), '%Y-%m-%d')
+    dt = pd.Timestamp(bill_date)
     clean_name = "".join(c for c in customer_name if c.isalnum() or c in (' ', '-', '_')).strip()
     month_year = dt.strftime('%Y-%m')
     folder_path = f"{BILL_DIR}/{month_year}/{clean_name}"
@@ -39,20 +47,264 @@ def safe_str(val, default=''):
         return default
     return str(val)
 
-def load_csv_from_drive(filename, default_cols):
-    """Load CSV from Google Drive"""
-    df = download_csv_from_drive(filename)
+def format_date(val):
+    """Format a stored date as YYYY-MM-DD"""
+    if pd.isna(val) or val == '':
+        return ''
+    try:
+        return pd.Timestamp(val).strftime('%Y-%m-%d')
+    except ValueError:
+        return str(val)
+
+# Column types of each table live in table_schema; every table is converted to
+# them when it is loaded and before it is saved
+TABLE_COLUMNS = {filename: table_columns(filename) for filename in TABLE_SCHEMAS}
+
+# Tables are keyed by their original CSV names; in storage each one is kept as
+# stored_name(filename) in the configured format (CSV, Parquet or Feather).
+# Tables that only ever grow are saved as small delta segments of their new rows
+# ("bills.delta.00001.csv", ...) on top of a base file, and compacted back into
+# the base once too many segments pile up or existing rows change.
+APPEND_ONLY_FILES = ('bills.csv', 'bill_items.csv', 'stock_movements.csv')
+COMPACT_AFTER_SEGMENTS = 20
+
+# Bills and bill items are stored as one append-only table per financial year
+# ("bills.2025-2026.csv", ...). Only the current year is loaded at startup;
+# older years are read on demand by reports. Items follow their bill's year.
+PARTITIONED_FILES = ('bills.csv', 'bill_items.csv')
+FY_PATTERN = re.compile(r"\d{4}-\d{4}")
+
+def with_default_columns(df, default_cols):
+    """Replace an empty/missing frame with an empty frame of the expected columns"""
     if df.empty:
         df = pd.DataFrame(columns=default_cols)
     return df
 
+def legacy_files(filename, index):
+    """Stored files of a table in formats other than the configured one"""
+    current = stored_name(filename)
+    names = [stored_name(filename, fmt) for fmt in FORMATS]
+    return [name for name in names if name != current and name in index]
+
+def base_file_name(filename, index):
+    """Stored file to read a table from: the configured format, else a legacy one to migrate"""
+    current = stored_name(filename)
+    if current in index:
+        return current
+    legacy = legacy_files(filename, index)
+    return legacy[0] if legacy else current
+
+def load_csv_from_drive(filename, default_cols):
+    """Load a table from the storage backend"""
+    backend = get_backend()
+    name = base_file_name(filename, backend.list())
+    return apply_schema(with_default_columns(backend.get([name])[name], default_cols), filename)
+
+def frame_hash(df):
+    """Content hash of a DataFrame (columns and values) used for change detection"""
+    digest = hashlib.md5("\x1f".join(map(str, df.columns)).encode('utf-8'))
+    digest.update(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+    return digest.hexdigest()
+
+def mark_clean(df, filename):
+    """Remember a frame's content as matching what is stored"""
+    st.session_state.setdefault('frame_hashes', {})[filename] = frame_hash(df)
+
+def is_dirty(df, filename):
+    """Check whether a frame changed since it was last loaded or uploaded"""
+    return st.session_state.get('frame_hashes', {}).get(filename) != frame_hash(df)
+
+def segment_name(filename, seq):
+    """Name of a delta segment of an append-only table, in the configured format"""
+    return stored_name(f"{split_ext(filename)[0]}.delta.{seq:05d}")
+
+def segment_seq(filename, name):
+    """Sequence number of a delta segment of filename (any format), or None if name is not one"""
+    stem, ext = split_ext(name)
+    prefix = f"{split_ext(filename)[0]}.delta."
+    if not ext or not stem.startswith(prefix):
+        return None
+    try:
+        return int(stem[len(prefix):])
+    except ValueError:
+        return None
+
+def partition_file(filename, fy):
+    """Name of one financial year's partition of bills or bill items"""
+    return f"{split_ext(filename)[0]}.{fy}.csv"
+
+def partition_of(name):
+    """(table, financial year) of a stored partition file or one of its segments, or None"""
+    stem = split_ext(name)[0].split('.delta.')[0]
+    for filename in PARTITIONED_FILES:
+        prefix = split_ext(filename)[0] + '.'
+        if stem.startswith(prefix) and FY_PATTERN.fullmatch(stem[len(prefix):]):
+            return filename, stem[len(prefix):]
+    return None
+
+def is_append_only(filename):
+    """Check whether a table (or a partition of one) is saved as delta segments"""
+    return filename in APPEND_ONLY_FILES or partition_of(filename) is not None
+
+def root_table(filename):
+    """Table a file holds rows of (a partition's own table)"""
+    return (partition_of(filename) or (filename,))[0]
+
+def table_for_file(name):
+    """Table a stored file belongs to (segments map to their base table or partition), or None"""
+    partition = partition_of(name)
+    if partition:
+        return partition_file(*partition)
+    stem = split_ext(name)[0]
+    for filename in TABLE_COLUMNS:
+        if split_ext(filename)[0] == stem:
+            return filename
+    for filename in APPEND_ONLY_FILES:
+        if segment_seq(filename, name) is not None:
+            return filename
+    return None
+
+def has_stored(filename, names):
+    """Check whether a table's base file exists among names, in any format"""
+    return any(stored_name(filename, fmt) in names for fmt in FORMATS)
+
+def unpartitioned_files(filename, names):
+    """Stored files of bills/bill items from before they were split by financial year"""
+    bases = [stored_name(filename, fmt) for fmt in FORMATS if stored_name(filename, fmt) in names]
+    return bases + [name for _, name in all_segments(filename, names)]
+
+def remember_bill_years(bills):
+    """Remember each bill's financial year, which its items are partitioned by"""
+    years = bills['fy'].astype(object).fillna(financial_year()).astype(str)
+    st.session_state.setdefault('bill_years', {}).update(zip(bills['bill_no'], years))
+
+def row_years(df, filename):
+    """Financial year of each row of bills or bill items (unknown bills count as this year)"""
+    if filename == 'bills.csv':
+        years = df['fy']
+    else:
+        years = df['bill_no'].map(st.session_state.get('bill_years', {}))
+    return years.astype(object).fillna(financial_year()).astype(str)
+
+def financial_years():
+    """Financial years that have bills, newest first (always including the current one)"""
+    backend = get_backend()
+    years = {financial_year()}
+    for name in list(backend.list()) + backend.pending_names():
+        partition = partition_of(name)
+        if partition and partition[0] == 'bills.csv':
+            years.add(partition[1])
+    return sorted(years, reverse=True)
+
+def compacted_through(filename, base_file):
+    """Highest segment sequence already folded into the base file"""
+    properties = (base_file or {}).get('appProperties') or {}
+    stored = int(properties.get('compacted_through', 0))
+    return max(stored, st.session_state.get('compacted_through', {}).get(filename, 0))
+
+def all_segments(filename, names):
+    """All delta segments of filename among names, as sorted (seq, name) pairs"""
+    segments = {(segment_seq(filename, name), name) for name in names}
+    return sorted(seg for seg in segments if seg[0] is not None)
+
+def compact_append_only(df, filename, segments, through, legacy):
+    """Rewrite the base file with every row and drop the segments folded into it"""
+    through = max([through] + [seq for seq, _ in segments])
+    names = [name for _, name in segments]
+    backend = get_backend()
+    for name in names:
+        backend.cancel(name)
+    
+    properties = {'compacted_through': str(through)}
+    if not backend.put(df, stored_name(filename), properties=properties, delete_after=names + legacy):
+        return False
+    
+    st.session_state.setdefault('compacted_through', {})[filename] = through
+    return True
+
+def save_append_only(df, filename):
+    """Queue only the rows added since the last load/save as a new delta segment"""
+    backend = get_backend()
+    index = backend.list()
+    names = list(index) + backend.pending_names()
+    through = compacted_through(filename, index.get(base_file_name(filename, index)))
+    segments = all_segments(filename, names)
+    live = [seg for seg in segments if seg[0] > through]
+    legacy = legacy_files(filename, index)
+    
+    rows = st.session_state.get('persisted_rows', {}).get(filename, 0)
+    known_hash = st.session_state.get('frame_hashes', {}).get(filename)
+    appended = 0 < rows <= len(df) and frame_hash(df.iloc[:rows]) == known_hash
+    has_base = stored_name(filename) in names
+    
+    if not appended or not has_base or len(live) >= COMPACT_AFTER_SEGMENTS:
+        return compact_append_only(df, filename, segments, through, legacy)
+    
+    seq = max([through] + [seq for seq, _ in segments]) + 1
+    return backend.put(df.iloc[rows:], segment_name(filename, seq), frame=df, new_file=True)
+
+def save_partitioned(df, filename):
+    """Save bills or bill items as one partition per financial year, skipping unchanged years"""
+    if filename == 'bills.csv':
+        remember_bill_years(df)
+    years = row_years(df, filename)
+    # Partitions loaded at startup are written even if they lost all their rows
+    loaded = st.session_state.get('partition_years', {}).get(filename, set())
+    
+    saved = False
+    for fy in sorted(set(years) | loaded):
+        part = df[years == fy].reset_index(drop=True)
+        if fy not in loaded:
+            # Only some bills of a year that was not loaded are in memory: the
+            # rest of its stored rows are kept, never overwritten
+            part = merge_stored_partition(part, filename, fy)
+        saved = save_csv_to_drive(part, partition_file(filename, fy)) or saved
+    return saved
+
+def stored_partition(filename, fy):
+    """One financial year of bills or bill items as stored (with writes not landed yet), read afresh"""
+    backend = get_backend()
+    name = partition_file(filename, fy)
+    stored = read_tables(backend, backend.list(), [name])[name]
+    for pending, df in backend.pending_frames().items():
+        if table_for_file(pending) == name:
+            stored = apply_schema(df, filename)
+    return stored
+
+def merge_stored_partition(rows, filename, fy):
+    """A partition's stored rows, the rows of bills in rows replaced by them"""
+    stored = stored_partition(filename, fy)
+    kept = stored[~stored['bill_no'].isin(rows['bill_no'])]
+    return apply_schema(pd.concat([kept, rows], ignore_index=True), filename)
+
 def save_csv_to_drive(df, filename):
-    """Save DataFrame to Google Drive"""
-    upload_csv_to_drive(df, filename)
+    """Save DataFrame through the storage backend, skipping it if unchanged since last load/save"""
+    if filename in PARTITIONED_FILES:
+        return save_partitioned(df, filename)
+    
+    df = apply_schema(df, root_table(filename))
+    if not is_dirty(df, filename):
+        return False
+    
+    if is_append_only(filename):
+        queued = save_append_only(df, filename)
+    else:
+        backend = get_backend()
+        legacy = legacy_files(filename, backend.list())
+        queued = backend.put(df, stored_name(filename), delete_after=legacy)
+    
+    if queued:
+        mark_clean(df, filename)
+        st.session_state.setdefault('persisted_rows', {})[filename] = len(df)
+        return True
+    return False
 
 def load_settings():
     """Load persistent settings"""
-    settings = load_csv_from_drive('settings.csv', ['logo_path', 'upi_id'])
+    return default_settings(load_csv_from_drive('settings.csv', TABLE_COLUMNS['settings.csv']))
+
+def default_settings(settings):
+    """Ensure the settings frame has its single row"""
     if settings.empty:
         settings.loc[0] = ['', '']
     return settings
@@ -62,57 +314,305 @@ def save_settings(logo_path, upi_id):
     settings = pd.DataFrame([[logo_path, upi_id]], columns=['logo_path', 'upi_id'])
     save_csv_to_drive(settings, 'settings.csv')
 
-@st.cache_data(ttl=60)  # Cache for 60 seconds
-def load_all_data():
-    """Load all data from Google Drive (cached)"""
-    customers = load_csv_from_drive('customers.csv', ['id','name','phone','gstin','address','place','ship_name','ship_address','ship_phone','ship_gstin'])
-    products = load_csv_from_drive('products.csv', ['id','name','hsn','price','gst','stock','mfg','exp','free','discount'])
-    bills = load_csv_from_drive('bills.csv', ['id','bill_no','fy','customer_id','bill_date','subtotal','cgst','sgst','igst','grand_total','payment_status'])
-    items_df = load_csv_from_drive('bill_items.csv', ['bill_no','product','qty','price','gst','mfg','exp','free','discount','batch_no'])
-    company_df = load_csv_from_drive('company.csv', ['name','gstin','msme','fssai','phone','address'])
-    settings_df = load_settings()
-    batches_df = load_csv_from_drive('batches.csv', ['id','product_id','batch_no','mfg_date','exp_date','quantity','price'])
-    stock_movements_df = load_csv_from_drive('stock_movements.csv', ['id','product_id','batch_no','movement_type','quantity','date','reference','notes'])
-    
-    if company_df.empty:
+def read_tables(backend, index, filenames):
+    """Read tables (base file plus live delta segments) in one batch, returning {filename: DataFrame}"""
+    base_names = {filename: base_file_name(filename, index) for filename in filenames}
+    segments = {
+        filename: [name for seq, name in all_segments(filename, index)
+                   if seq > compacted_through(filename, index.get(base_names[filename]))]
+        for filename in filenames if is_append_only(filename)
+    }
+    
+    downloaded = backend.get(list(base_names.values()) + [name for names in segments.values() for name in names])
+    frames = {filename: downloaded[name] for filename, name in base_names.items()}
+    for filename, names in segments.items():
+        parts = [frames[filename]] + [downloaded[name] for name in names]
+        parts = [part for part in parts if not part.empty]
+        if len(parts) > 1:
+            frames[filename] = pd.concat(parts, ignore_index=True)
+        elif parts:
+            frames[filename] = parts[0]
+    
+    return {filename: apply_schema(df, root_table(filename)) for filename, df in frames.items()}
+
+def load_group(filename):
+    """Tables loaded together with a table (bills and items are split by year as one)"""
+    return PARTITIONED_FILES if filename in PARTITIONED_FILES else (filename,)
+
+def startup_files(index, tables=tuple(TABLE_COLUMNS)):
+    """Files to read for tables: all but the older financial years of bills and items"""
+    fy = financial_year()
+    filenames = []
+    for filename in tables:
+        if filename in PARTITIONED_FILES:
+            filenames.append(partition_file(filename, fy))
+            # Not yet split by year: read the whole table once to migrate it
+            if unpartitioned_files(filename, index):
+                filenames.append(filename)
+        else:
+            filenames.append(filename)
+    return filenames
+
+def prepare_tables(frames):
+    """Fill in the single rows company and settings need (read_tables already added missing columns)"""
+    if 'settings.csv' in frames:
+        frames['settings.csv'] = default_settings(frames['settings.csv'])
+    
+    company_df = frames.get('company.csv')
+    if company_df is not None and company_df.empty:
         company_df.loc[0] = ['', '', '', '', '', '']
     
-    for col in ['mfg','exp','free','discount','hsn']:
-        if col not in products.columns:
-            products[col] = '' if col in ['mfg','exp','hsn'] else 0
-    
-    for col in ['place','ship_name','ship_address','ship_phone','ship_gstin']:
-        if col not in customers.columns:
-            customers[col] = ''
-    
-    for col in ['msme', 'fssai', 'phone']:
-        if col not in company_df.columns:
-            company_df[col] = ''
-    
-    if 'batch_no' not in items_df.columns:
-        items_df['batch_no'] = ''
-    
-    return customers, products, bills, items_df, company_df, settings_df, batches_df, stock_movements_df
-
-def save_all_data(customers, products, bills, items_df, company_df, batches_df, stock_movements_df):
-    """Save all dataframes to Google Drive"""
-    save_csv_to_drive(company_df, 'company.csv')
-    save_csv_to_drive(customers, 'customers.csv')
-    save_csv_to_drive(products, 'products.csv')
-    save_csv_to_drive(bills, 'bills.csv')
-    save_csv_to_drive(items_df, 'bill_items.csv')
-    save_csv_to_drive(batches_df, 'batches.csv')
-    save_csv_to_drive(stock_movements_df, 'stock_movements.csv')
-
-def record_stock_movement(stock_movements_df, product_id, batch_no, movement_type, quantity, reference, notes=""):
-    """Record stock movement"""
-    new_id = 1 if stock_movements_df.empty else int(stock_movements_df['id'].max()) + 1
-    new_movement = pd.DataFrame([[
-        new_id, product_id, batch_no, movement_type, quantity, 
-        str(date.today()), reference, notes
-    ]], columns=['id','product_id','batch_no','movement_type','quantity','date','reference','notes'])
-    
-    return pd.concat([stock_movements_df, new_movement], ignore_index=True)
+    return frames
+
+@st.cache_data(ttl=60)  # Cache for 60 seconds
+def _load_tables_cached(tables):
+    """Load tables from the storage backend (cached), with the current year of bills and items"""
+    # One listing finds the delta segments (and revalidates Drive's local mirror)
+    backend = get_backend()
+    index = backend.list(refresh=True)
+    return prepare_tables(read_tables(backend, index, startup_files(index, tables)))
+
+def forget_changed_tables(backend, changed, landed):
+    """Drop this session's copies of tables changed since the last load"""
+    filenames = startup_files(backend.list())
+    changed_tables = {table_for_file(name) for name in changed} - {None}
+    cache = st.session_state.get('table_cache', {})
+    
+    if changed_tables - set(filenames):
+        _load_history_cached.clear()
+    # A landed write of this session may not be in the changes feed yet
+    st.session_state['table_cache'] = {} if landed else {
+        filename: cache[filename] for filename in filenames if filename in cache and filename not in changed_tables
+    }
+
+def load_changed_tables(backend, tables):
+    """Tables from this session's copy, reading those not copied yet or dropped as changed"""
+    index = backend.list()
+    filenames = startup_files(index, tables)
+    cache = st.session_state.setdefault('table_cache', {})
+    stale = [filename for filename in filenames if filename not in cache]
+    if stale:
+        cache.update(prepare_tables(read_tables(backend, index, stale)))
+    
+    # The tabs edit frames in place, so they get copies
+    return {filename: cache[filename].copy() for filename in filenames}
+
+@st.cache_data(ttl=600)
+def _load_history_cached(filenames):
+    """Load older financial-year partitions from the storage backend (cached)"""
+    backend = get_backend()
+    return read_tables(backend, backend.list(), list(filenames))
+
+def refresh_stale_caches(backend):
+    """Drop cached loads once a write has landed; True if one has"""
+    generation = backend.write_generation()
+    if generation == st.session_state.get('write_generation', 0):
+        return False
+    _load_tables_cached.clear()
+    _load_history_cached.clear()
+    st.session_state['write_generation'] = generation
+    return True
+
+def split_unpartitioned(frames, stored):
+    """Take bills/items not yet split by year out of frames, merging the current year's rows"""
+    fy = financial_year()
+    unpartitioned = {}
+    for filename in PARTITIONED_FILES:
+        if filename not in frames:
+            continue
+        df = frames.pop(filename)
+        if filename == 'bills.csv':
+            remember_bill_years(df)
+        years = row_years(df, filename)
+        unpartitioned[filename] = (df, years)
+        
+        current = partition_file(filename, fy)
+        if not has_stored(current, stored):
+            frames[current] = df[years == fy].reset_index(drop=True)
+    return unpartitioned
+
+def migrate_partitions(frames, unpartitioned, index, stored):
+    """Write each year of an unsplit table as its own partition, deleting the old files once all have landed"""
+    fy = financial_year()
+    for filename, (df, years) in unpartitioned.items():
+        for year in sorted(set(years) - {fy}):
+            partition = partition_file(filename, year)
+            if not has_stored(partition, stored):
+                save_csv_to_drive(df[years == year].reset_index(drop=True), partition)
+        
+        current = partition_file(filename, fy)
+        if not has_stored(current, stored):
+            st.session_state['frame_hashes'].pop(current)
+            save_csv_to_drive(frames[current], current)
+    
+    # Items are split by their bills' years, so the old files of both tables
+    # go together, and only once every partition has landed
+    pending = set(get_backend().pending_names())
+    ready = all(
+        has_stored(partition_file(filename, year), index) and not has_stored(partition_file(filename, year), pending)
+        for filename, (df, years) in unpartitioned.items() for year in set(years) | {fy}
+    )
+    if not ready:
+        return
+    for filename in unpartitioned:
+        # Rewriting this year's partition drops the old files once it is stored
+        current = partition_file(filename, fy)
+        through = compacted_through(current, index.get(base_file_name(current, index)))
+        segments = all_segments(current, index)
+        old_files = legacy_files(current, index) + unpartitioned_files(filename, index)
+        compact_append_only(frames[current], current, segments, through, old_files)
+
+def open_tables():
+    """Start this run's loading: returns load_tables(tables) for the tables the run asks for
+
+    Backends with a changes feed keep a session copy of every table and re-read
+    only what changed; others reload on expiry of the cached load.
+    """
+    backend = get_backend()
+    landed = refresh_stale_caches(backend)
+    changed = backend.changes(force=landed)
+    if changed is not None:
+        forget_changed_tables(backend, changed, landed)
+    return partial(load_tables, feed=changed is not None)
+
+def load_tables(tables, feed=False):
+    """Load tables, overlaying writes that have not landed yet, and remember their state for dirty tracking
+
+    Returns {table: DataFrame}, with the current financial year of bills and items.
+    """
+    backend = get_backend()
+    tables = tuple(tables)
+    frames = load_changed_tables(backend, tables) if feed else _load_tables_cached(tables)
+    pending = backend.pending_frames()
+    for name, df in pending.items():
+        if table_for_file(name) in frames:
+            frames[table_for_file(name)] = df
+    
+    fy = financial_year()
+    index = backend.list()
+    stored = set(index) | set(pending)
+    if 'bills.csv' in tables:
+        remember_bill_years(frames[partition_file('bills.csv', fy)])
+    unpartitioned = split_unpartitioned(frames, stored)
+    
+    for filename, df in frames.items():
+        mark_clean(df, filename)
+        st.session_state.setdefault('persisted_rows', {})[filename] = len(df)
+    
+    partition_years = st.session_state.setdefault('partition_years', {})
+    partition_years.update({filename: {fy} for filename in PARTITIONED_FILES if filename in tables})
+    migrate_partitions(frames, unpartitioned, index, stored)
+    
+    # Tables still stored in another format are rewritten in the configured one
+    for filename, df in frames.items():
+        current = stored_name(filename)
+        if current not in index and current not in pending and legacy_files(filename, index):
+            st.session_state['frame_hashes'].pop(filename)
+            save_csv_to_drive(df, filename)
+    
+    return {filename: frames[partition_file(filename, fy) if filename in PARTITIONED_FILES else filename]
+            for filename in tables}
+
+def load_history(filename, years):
+    """Load older financial years of bills or bill items on demand"""
+    backend = get_backend()
+    refresh_stale_caches(backend)
+    
+    names = tuple(partition_file(filename, fy) for fy in sorted(set(years)) if fy != financial_year())
+    frames = _load_history_cached(names) if names else {}
+    for name, df in backend.pending_frames().items():
+        if table_for_file(name) in frames:
+            frames[table_for_file(name)] = df
+    
+    parts = [df for df in frames.values() if not df.empty]
+    if not parts:
+        return apply_schema(pd.DataFrame(), filename)
+    return apply_schema(pd.concat(parts, ignore_index=True), filename)
+
+def with_history(df, filename, years):
+    """A current-year table extended with the given older financial years"""
+    history = load_history(filename, years)
+    if history.empty:
+        return df
+    return apply_schema(pd.concat([history, df], ignore_index=True), filename)
+
+# New row ids come from a counter per table, taken a block at a time so most
+# inserts never touch storage. Ids left in a block when the session ends are
+# never used.
+ID_BLOCK_SIZE = 10
+
+def id_floor(df, filename):
+    """Highest id a table already uses (bills of every financial year)"""
+    if filename in PARTITIONED_FILES:
+        df = with_history(df, filename, financial_years())
+    ids = df['id'].dropna()
+    return int(ids.max()) if len(ids) else 0
+
+def fill_id_blocks(needs):
+    """Make this session's id blocks hold enough ids, {filename: (df, count)}, refilling them in one counter update"""
+    blocks = st.session_state.setdefault('id_blocks', {})
+    backend = get_backend()
+    takes = {}
+    for filename, (df, count) in needs.items():
+        first, end = blocks.get(filename, (0, 0))
+        if first + count > end:
+            counter = f"id/{split_ext(filename)[0]}"
+            # A new counter starts past every stored id; once it exists every id
+            # comes from it, so history is only scanned then
+            floor = 0 if backend.counter(counter) else id_floor(df, filename)
+            takes[filename] = (counter, max(count, ID_BLOCK_SIZE), floor)
+    if not takes:
+        return
+    taken = backend.take_counters({counter: (size, floor) for counter, size, floor in takes.values()})
+    for filename, (counter, size, _) in takes.items():
+        blocks[filename] = (taken[counter], taken[counter] + size)
+
+def new_ids(df, filename, count=1):
+    """Take count consecutive new ids for a table, returning the first"""
+    fill_id_blocks({filename: (df, count)})
+    blocks = st.session_state['id_blocks']
+    first, end = blocks[filename]
+    blocks[filename] = (first + count, end)
+    return first
+
+def find_rows(df, filename, column, value):
+    """Rows of a table where column == value, from an indexed backend query when available"""
+    rows = get_backend().lookup(filename, column, value)
+    if rows is None:
+        return df[df[column] == value]
+    return apply_schema(rows, root_table(filename))
+
+MOVEMENT_FIELDS = ['product_id', 'batch_no', 'movement_type', 'quantity', 'reference', 'notes']
+
+class StockMovements:
+    """Stock movements of one transaction (a sale, a new batch, an adjustment), recorded together"""
+
+    def __init__(self, repo):
+        self.repo = repo
+        self.movements = []
+
+    def add(self, product_id, batch_no, movement_type, quantity, reference, notes=""):
+        """Queue a stock movement"""
+        self.movements.append((product_id, batch_no, movement_type, quantity, reference, notes))
+
+    def add_rows(self, rows):
+        """Queue movements given as a frame of MOVEMENT_FIELDS columns"""
+        self.movements.extend(rows[MOVEMENT_FIELDS].itertuples(index=False, name=None))
+
+    def rows(self):
+        """Take the queued movements as new table rows, with consecutive new ids"""
+        rows = pd.DataFrame(self.movements, columns=MOVEMENT_FIELDS)
+        if len(rows):
+            first = new_ids(self.repo['stock_movements.csv'], 'stock_movements.csv', count=len(rows))
+            rows.insert(0, 'id', range(first, first + len(rows)))
+        rows['date'] = str(date.today())
+        self.movements = []
+        return rows
+
+    def record(self):
+        """Append the queued movements in one insert"""
+        if self.movements:
+            self.repo.insert('stock_movements.csv', self.rows())
 
 
 
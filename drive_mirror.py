@@ -0,0 +1,101 @@
+# drive_mirror.py - local disk copy of Drive files, keyed by Drive fileId
+import os
+import json
+import threading
+
+MIRROR_DIR = os.path.join("data", "mirror")
+MANIFEST_FILE = os.path.join(MIRROR_DIR, "manifest.json")
+
+_lock = threading.Lock()
+_manifest = None
+
+
+def _get_manifest():
+    """Load the fileId -> {name, md5Checksum, modifiedTime} manifest once per process"""
+    global _manifest
+    if _manifest is None:
+        try:
+            with open(MANIFEST_FILE, "r", encoding="utf-8") as f:
+                _manifest = json.load(f)
+        except (OSError, ValueError):
+            _manifest = {}
+    return _manifest
+
+
+def _save_manifest(manifest):
+    """Write the manifest atomically so a crash never leaves it half written"""
+    tmp_path = MANIFEST_FILE + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp_path, MANIFEST_FILE)
+
+
+def _mirror_path(file_id):
+    return os.path.join(MIRROR_DIR, file_id)
+
+
+def _matches(entry, file):
+    """Check whether a manifest entry describes the same revision as Drive metadata"""
+    if file.get('md5Checksum'):
+        return entry.get('md5Checksum') == file['md5Checksum']
+    return bool(file.get('modifiedTime')) and entry.get('modifiedTime') == file['modifiedTime']
+
+
+def read_mirror(file):
+    """Get the mirrored bytes of a Drive file, or None if missing or out of date"""
+    with _lock:
+        entry = _get_manifest().get(file['id'])
+        if not entry or not _matches(entry, file):
+            return None
+        try:
+            with open(_mirror_path(file['id']), "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+
+def write_mirror(file, data):
+    """Store the bytes of a Drive file revision in the mirror"""
+    with _lock:
+        os.makedirs(MIRROR_DIR, exist_ok=True)
+        path = _mirror_path(file['id'])
+        with open(path + ".tmp", "wb") as f:
+            f.write(data)
+        os.replace(path + ".tmp", path)
+
+        manifest = _get_manifest()
+        manifest[file['id']] = {
+            'name': file.get('name'),
+            'md5Checksum': file.get('md5Checksum'),
+            'modifiedTime': file.get('modifiedTime'),
+        }
+        _save_manifest(manifest)
+
+
+def _drop(manifest, file_ids):
+    """Remove files from the manifest and the mirror directory; True if any were mirrored"""
+    dropped = False
+    for file_id in file_ids:
+        if manifest.pop(file_id, None) is not None:
+            dropped = True
+        try:
+            os.remove(_mirror_path(file_id))
+        except OSError:
+            pass
+    return dropped
+
+
+def forget_mirror(file_ids):
+    """Drop the mirrored copies of Drive files that were deleted"""
+    with _lock:
+        manifest = _get_manifest()
+        if _drop(manifest, file_ids):
+            _save_manifest(manifest)
+
+
+def prune_mirror(file_ids):
+    """Drop the mirrored copies of every file not among file_ids (a fresh folder listing)"""
+    with _lock:
+        manifest = _get_manifest()
+        if _drop(manifest, set(manifest) - set(file_ids)):
+            _save_manifest(manifest)
@@ -0,0 +1,80 @@
+# drive_pool.py - pool of authorized Drive clients, one set per user
+import hashlib
+import threading
+import time
+from contextlib import contextmanager
+
+MAX_IDLE_CLIENTS = 8
+IDLE_SECONDS = 300
+
+
+def credential_key(creds_data):
+    """Stable pool key for a user's stored credentials (the access token changes on refresh)"""
+    secret = creds_data.get('refresh_token') or creds_data['token']
+    return hashlib.sha256(f"{creds_data.get('client_id')}:{secret}".encode('utf-8')).hexdigest()
+
+
+class DrivePool:
+    """Lends each caller a Drive client of its own, keeping idle ones warm for reuse"""
+
+    def __init__(self, make_client, max_idle=MAX_IDLE_CLIENTS, idle_seconds=IDLE_SECONDS):
+        # make_client(creds_data) builds a new client; a client is never shared by
+        # two threads at once because httplib2 transports are not thread-safe
+        self._make_client = make_client
+        self._max_idle = max_idle
+        self._idle_seconds = idle_seconds
+        self._lock = threading.Lock()
+        self._idle = {}  # key -> [(client, released_at)], most recently used last
+
+    @contextmanager
+    def client(self, creds_data):
+        """Borrow a client for these credentials for the duration of a with block"""
+        key = credential_key(creds_data)
+        client = self._take(key)
+        if client is None:
+            client = self._make_client(creds_data)
+        try:
+            yield client
+        finally:
+            self._give_back(key, client)
+
+    def _take(self, key):
+        with self._lock:
+            self._evict_expired()
+            clients = self._idle.get(key)
+            if not clients:
+                return None
+            client = clients.pop()[0]
+            if not clients:
+                del self._idle[key]
+            return client
+
+    def _give_back(self, key, client):
+        with self._lock:
+            self._idle.setdefault(key, []).append((client, time.monotonic()))
+            # Over the bound: close the clients that have been idle longest
+            idle = sorted(((released, k, c) for k, clients in self._idle.items() for c, released in clients),
+                          key=lambda entry: entry[0])
+            for _, k, c in idle[:max(0, len(idle) - self._max_idle)]:
+                self._drop(k, c)
+
+    def _evict_expired(self):
+        deadline = time.monotonic() - self._idle_seconds
+        for key, clients in list(self._idle.items()):
+            for client, released in list(clients):
+                if released < deadline:
+                    self._drop(key, client)
+
+    def _drop(self, key, client):
+        clients = self._idle.get(key, [])
+        clients[:] = [entry for entry in clients if entry[0] is not client]
+        if not clients:
+            self._idle.pop(key, None)
+        client.close()
+
+    def discard(self, creds_data):
+        """Close every idle client of these credentials (on logout)"""
+        key = credential_key(creds_data)
+        with self._lock:
+            for client, _ in list(self._idle.get(key, [])):
+                self._drop(key, client)
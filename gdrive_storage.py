@@ -2,21 +2,47 @@
 import streamlit as st
 import pandas as pd
 import io
+import json
+import re
 import time
+import threading
+import httplib2
+from concurrent.futures import ThreadPoolExecutor
 from google.oauth2.credentials import Credentials
+from google_auth_httplib2 import AuthorizedHttp
 from google_auth_oauthlib.flow import Flow
 from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseDownload, MediaIoBaseUpload
+from googleapiclient.http import MediaIoBaseDownload, MediaInMemoryUpload
 from googleapiclient.errors import HttpError
+from upload_queue import UploadQueue
+from drive_pool import DrivePool
+from retry_policy import RetryPolicy, is_retryable
+from drive_mirror import forget_mirror, prune_mirror, read_mirror, write_mirror
+from storage_formats import serialize, deserialize, mimetype_for_name
 
 SCOPES = ['https://www.googleapis.com/auth/drive.file']
+FILE_FIELDS = 'id, name, modifiedTime, md5Checksum, appProperties'
+CHANGE_FIELDS = f"nextPageToken, newStartPageToken, changes(fileId, removed, file({FILE_FIELDS}, parents, trashed))"
+CHANGES_POLL_SECONDS = 5
+DOWNLOAD_WORKERS = 4
+HTTP_TIMEOUT = 30
+SIMPLE_UPLOAD_LIMIT = 5 * 1024 * 1024  # larger files use resumable uploads
+UPLOAD_CHUNK_SIZE = 1024 * 1024        # must be a multiple of 256KB
+COUNTERS_FILE = 'counters.json'
+JOURNAL_PREFIX = 'journal-'
+
+# Counter updates of all sessions in this process go one at a time
+counters_lock = threading.Lock()
 
 def get_credentials():
     """Get user credentials from session state"""
     if 'credentials' not in st.session_state:
         return None
     
-    creds_data = st.session_state['credentials']
+    return credentials_from_data(st.session_state['credentials'])
+
+def credentials_from_data(creds_data):
+    """Build Credentials from the stored credentials dict"""
     creds = Credentials(
         token=creds_data['token'],
         refresh_token=creds_data.get('refresh_token'),
@@ -34,9 +60,15 @@ def google_drive_login():
     if 'credentials' in st.session_state:
         st.sidebar.success("✅ Connected")
         if st.sidebar.button("🚪 Logout"):
-            del st.session_state['credentials']
-            if 'folder_id' in st.session_state:
-                del st.session_state['folder_id']
+            queue = st.session_state.get('upload_queue')
+            if queue and not queue.flush(timeout=60):
+                st.sidebar.error("⚠️ Some changes are not on Drive yet. Retry the upload before logging out.")
+                return True
+            _pool.discard(st.session_state.pop('credentials'))
+            for key in ('folder_id', 'drive_index', 'drive_index_lock', 'drive_index_missing', 'drive_index_stats', 'upload_queue',
+                        'drive_changes_token', 'drive_changes_polled', 'drive_counters', 'drive_journal', 'id_blocks'):
+                if key in st.session_state:
+                    del st.session_state[key]
             st.rerun()
         return True
     
@@ -99,64 +131,67 @@ def google_drive_login():
     
     return False
 
-@st.cache_resource(ttl=300)  # Cache for 5 minutes
-def get_drive_service(_creds):
-    """Get Google Drive service with timeout"""
-    import socket
-    socket.setdefaulttimeout(30)  # 30 second timeout
-    return build('drive', 'v3', credentials=_creds, cache_discovery=False)
+def build_drive_service(creds_data):
+    """Build a Drive service with its own keep-alive connection and timeout"""
+    http = AuthorizedHttp(credentials_from_data(creds_data), http=httplib2.Http(timeout=HTTP_TIMEOUT))
+    return build('drive', 'v3', http=http, cache_discovery=False)
 
-def retry_api_call(func, max_retries=3, delay=2):
-    """Retry API calls on timeout"""
-    for attempt in range(max_retries):
-        try:
-            return func()
-        except Exception as e:
-            if attempt < max_retries - 1:
-                time.sleep(delay)
-                continue
-            raise e
+# Shared by all sessions and upload/download threads; keyed by user
+_pool = DrivePool(build_drive_service)
+
+def drive_service(creds_data):
+    """Borrow a pooled Drive service for these credentials (use in a with block)"""
+    return _pool.client(creds_data)
+
+# One policy for the whole process: a Drive outage trips the breaker for every session
+_retry_policy = RetryPolicy()
+
+def retry_api_call(func):
+    """Call the Drive API, retrying transient errors with backoff behind a circuit breaker"""
+    return _retry_policy.call(func)
+
+def get_retry_status():
+    """Get the circuit breaker state and retry counters"""
+    return _retry_policy.status()
 
 def get_or_create_app_folder():
     """Get or create GST BillBook folder"""
     if 'folder_id' in st.session_state:
         return st.session_state['folder_id']
     
-    creds = get_credentials()
-    if not creds:
+    if 'credentials' not in st.session_state:
         return None
     
     try:
-        service = get_drive_service(creds)
-        
-        def search_folder():
-            query = "name='GST_BillBook_Data' and mimeType='application/vnd.google-apps.folder' and trashed=false"
-            return service.files().list(
-                q=query, 
-                fields="files(id, name)",
-                pageSize=10
-            ).execute()
+        with drive_service(st.session_state['credentials']) as service:
+            def search_folder():
+                query = "name='GST_BillBook_Data' and mimeType='application/vnd.google-apps.folder' and trashed=false"
+                return service.files().list(
+                    q=query, 
+                    fields="files(id, name)",
+                    pageSize=10
+                ).execute()
         
-        # Retry search with timeout handling
-        results = retry_api_call(search_folder)
-        folders = results.get('files', [])
+            # Retry search with timeout handling
+            results = retry_api_call(search_folder)
+            folders = results.get('files', [])
         
-        if folders:
-            folder_id = folders[0]['id']
-        else:
-            # Create new folder
-            def create_folder():
-                file_metadata = {
-                    'name': 'MOOFUs_Billbook_Data',
-                    'mimeType': 'application/vnd.google-apps.folder'
-                }
-                return service.files().create(
-                    body=file_metadata, 
-                    fields='id'
-                ).execute()
+            if folders:
+                folder_id = folders[0]['id']
+            else:
+                # Create new folder
+                def create_folder():
+                    file_metadata = {
+                        'name': 'MOOFUs_Billbook_Data',
+                        'mimeType': 'application/vnd.google-apps.folder'
+                    }
+                    return service.files().create(
+                        body=file_metadata, 
+                        fields='id'
+                    ).execute()
             
-            folder = retry_api_call(create_folder)
-            folder_id = folder['id']
+                folder = retry_api_call(create_folder)
+                folder_id = folder['id']
         
         st.session_state['folder_id'] = folder_id
         return folder_id
@@ -166,110 +201,442 @@ def get_or_create_app_folder():
         return None
 
 def list_files_in_folder():
-    """List all files in app folder"""
-    creds = get_credentials()
-    if not creds:
+    """List all files in app folder, raising if Drive cannot be reached"""
+    if 'credentials' not in st.session_state:
         return []
     
+    # An empty listing would make every table look empty, so failures are raised
     folder_id = get_or_create_app_folder()
     if not folder_id:
-        return []
+        raise ConnectionError("the Google Drive app folder could not be opened")
     
-    try:
-        service = get_drive_service(creds)
+    with drive_service(st.session_state['credentials']) as service:
+        files = []
+        page_token = None
         
-        def list_files():
-            return service.files().list(
-                q=f"'{folder_id}' in parents and trashed=false",
-                fields="files(id, name)",
-                pageSize=100
-            ).execute()
+        while True:
+            def list_files():
+                return service.files().list(
+                    q=f"'{folder_id}' in parents and trashed=false",
+                    fields=f"nextPageToken, files({FILE_FIELDS})",
+                    pageSize=100,
+                    pageToken=page_token
+                ).execute()
+            
+            results = retry_api_call(list_files)
+            files.extend(results.get('files', []))
+            page_token = results.get('nextPageToken')
+            if not page_token:
+                return files
+
+def get_index_stats():
+    """Get hit/miss counters for the folder index"""
+    if 'drive_index_stats' not in st.session_state:
+        st.session_state['drive_index_stats'] = {'hits': 0, 'misses': 0, 'refreshes': 0}
+    return st.session_state['drive_index_stats']
+
+def folder_index_lock():
+    """Lock held while changing or copying the folder index (the upload worker changes it too)"""
+    return st.session_state.setdefault('drive_index_lock', threading.Lock())
+
+def get_folder_index(refresh=False):
+    """Get the per-session filename -> file metadata index, listing the folder only when needed"""
+    if refresh or 'drive_index' not in st.session_state:
+        files = list_files_in_folder()
+        # Refresh in place: the upload worker holds references to these objects
+        with folder_index_lock():
+            index = st.session_state.setdefault('drive_index', {})
+            index.clear()
+            index.update({f['name']: f for f in files})
+        # Files deleted since the mirror last saw them are dropped from it
+        prune_mirror(f['id'] for f in files)
+        st.session_state.setdefault('drive_index_missing', set()).clear()
+        get_index_stats()['refreshes'] += 1
+    return st.session_state['drive_index']
+
+def folder_index_snapshot(refresh=False):
+    """A copy of the folder index, safe to loop over while uploads change the index"""
+    index = get_folder_index(refresh)
+    with folder_index_lock():
+        return dict(index)
+
+def find_file(filename):
+    """Look up a file in the folder index, re-listing the folder on a cache miss"""
+    index = get_folder_index()
+    stats = get_index_stats()
+    
+    file = index.get(filename)
+    if file is not None:
+        stats['hits'] += 1
+        return file
+    
+    stats['misses'] += 1
+    # A name already missing after the last listing is not re-listed again until
+    # the next refresh, otherwise every rerun would list the folder for it.
+    if filename in st.session_state['drive_index_missing']:
+        return None
+    
+    index = get_folder_index(refresh=True)
+    if filename not in index:
+        st.session_state['drive_index_missing'].add(filename)
+    return index.get(filename)
+
+def poll_changes(force=False):
+    """Names of app-folder files changed since the last poll, keeping the folder index current
+
+    The first poll lists the folder and reports every file. Later polls read
+    the Drive changes feed, at most once every CHANGES_POLL_SECONDS unless forced.
+    """
+    if 'credentials' not in st.session_state:
+        return set()
+    
+    token = st.session_state.get('drive_changes_token')
+    polled = st.session_state.get('drive_changes_polled', 0)
+    if token and not force and time.monotonic() - polled < CHANGES_POLL_SECONDS:
+        return set()
+    
+    folder_id = get_or_create_app_folder()
+    with drive_service(st.session_state['credentials']) as service:
+        if not token:
+            # Take the token before listing so nothing changed in between is missed
+            start = retry_api_call(lambda: service.changes().getStartPageToken().execute())
+            st.session_state['drive_changes_token'] = start['startPageToken']
+            st.session_state['drive_changes_polled'] = time.monotonic()
+            return set(folder_index_snapshot(refresh=True))
         
-        results = retry_api_call(list_files)
-        return results.get('files', [])
+        index = get_folder_index()
+        changed = set()
+        while True:
+            result = retry_api_call(lambda: service.changes().list(
+                pageToken=token,
+                spaces='drive',
+                includeRemoved=True,
+                fields=CHANGE_FIELDS,
+                pageSize=1000
+            ).execute())
+            for change in result.get('changes', []):
+                changed.update(apply_change(index, folder_id, change))
+            token = result.get('nextPageToken')
+            if not token:
+                break
+    
+    st.session_state['drive_changes_token'] = result['newStartPageToken']
+    st.session_state['drive_changes_polled'] = time.monotonic()
+    return changed
+
+def apply_change(index, folder_id, change):
+    """Apply one Drive change to the folder index, returning the affected file names"""
+    file = change.get('file') or {}
+    gone = change.get('removed') or file.get('trashed') or folder_id not in file.get('parents', [])
+    with folder_index_lock():
+        names = {name for name, entry in index.items() if entry.get('id') == change['fileId']}
+        for name in names:
+            index.pop(name, None)
+        if gone:
+            forget_mirror([change['fileId']])
+            return names
         
-    except Exception as e:
-        # Return empty list on error instead of showing error
-        return []
+        entry = {key: value for key, value in file.items() if key not in ('parents', 'trashed')}
+        index[entry['name']] = entry
+    st.session_state['drive_index_missing'].discard(entry['name'])
+    return names | {entry['name']}
 
-def upload_csv_to_drive(df, filename):
-    """Upload DataFrame as CSV to Google Drive"""
-    creds = get_credentials()
-    if not creds:
-        return None
+def update_folder_index(file):
+    """Record a created/updated file in the folder index"""
+    index = get_folder_index()
+    with folder_index_lock():
+        index[file['name']] = file
+    st.session_state['drive_index_missing'].discard(file['name'])
+
+def store_file(service, folder_id, filename, data, existing_file, properties=None, mimetype=None):
+    """Create or update a file in the app folder, raising on failure"""
+    file_metadata = {'name': filename}
+    if not existing_file:
+        file_metadata['parents'] = [folder_id]
+    if properties:
+        file_metadata['appProperties'] = properties
+    
+    # Small files go in one multipart request; a resumable session costs an
+    # extra round trip and only pays off when a large upload can be resumed
+    resumable = len(data) > SIMPLE_UPLOAD_LIMIT
+    media = MediaInMemoryUpload(
+        data,
+        mimetype=mimetype or mimetype_for_name(filename),
+        resumable=resumable,
+        chunksize=UPLOAD_CHUNK_SIZE
+    )
+    
+    def upload_request():
+        if existing_file:
+            return service.files().update(
+                fileId=existing_file['id'],
+                body={'appProperties': properties} if properties else None,
+                media_body=media,
+                fields=FILE_FIELDS
+            )
+        else:
+            return service.files().create(
+                body=file_metadata,
+                media_body=media,
+                fields=FILE_FIELDS
+            )
+    
+    if resumable:
+        file = upload_resumable(upload_request())
+    else:
+        file = retry_api_call(lambda: upload_request().execute())
+    write_mirror(file, data)
+    return file
+
+def upload_resumable(request):
+    """Send a resumable upload chunk by chunk; a retried chunk resumes where Drive stopped"""
+    response = None
+    while response is None:
+        _, response = retry_api_call(request.next_chunk)
+    return response
+
+def delete_file(service, file_id):
+    """Delete a file from Drive, raising on failure"""
+    retry_api_call(lambda: service.files().delete(fileId=file_id).execute())
+    forget_mirror([file_id])
+
+def get_upload_queue():
+    """Get this session's write-behind upload queue"""
+    if 'upload_queue' in st.session_state:
+        return st.session_state['upload_queue']
     
+    if 'credentials' not in st.session_state:
+        return None
     folder_id = get_or_create_app_folder()
     if not folder_id:
         return None
     
-    try:
-        service = get_drive_service(creds)
-        
-        csv_buffer = io.StringIO()
-        df.to_csv(csv_buffer, index=False)
-        csv_buffer.seek(0)
-        
-        existing_files = list_files_in_folder()
-        existing_file = next((f for f in existing_files if f['name'] == filename), None)
-        
-        file_metadata = {'name': filename}
-        if not existing_file:
-            file_metadata['parents'] = [folder_id]
-        
-        media = MediaIoBaseUpload(
-            io.BytesIO(csv_buffer.getvalue().encode('utf-8')),
-            mimetype='text/csv',
-            resumable=True,
-            chunksize=256*1024  # 256KB chunks
-        )
-        
-        def upload():
-            if existing_file:
-                return service.files().update(
-                    fileId=existing_file['id'],
-                    media_body=media
-                ).execute()
+    # The worker thread has no script context, so capture everything it needs here
+    creds_data = dict(st.session_state['credentials'])
+    index = get_folder_index()
+    lock = folder_index_lock()
+    missing = st.session_state['drive_index_missing']
+    
+    def upload(filename, payload):
+        data, properties, delete_after, mimetype = payload
+        with drive_service(creds_data) as service:
+            if data is None:
+                # A queued deletion: the file itself is removed
+                delete_after = (filename,)
             else:
-                return service.files().create(
-                    body=file_metadata,
-                    media_body=media,
-                    fields='id'
-                ).execute()
-        
-        file = retry_api_call(upload)
-        return file.get('id')
-        
-    except Exception as e:
-        st.warning(f"Upload delayed for {filename}")
-        return None
+                file = store_file(service, folder_id, filename, data, index.get(filename),
+                                  properties=properties, mimetype=mimetype)
+                with lock:
+                    index[filename] = file
+                missing.discard(filename)
+            
+            # Files superseded by this one are only removed once it is safely stored
+            for name in delete_after:
+                old = index.get(name)
+                if old is not None:
+                    delete_file(service, old['id'])
+                    with lock:
+                        index.pop(name, None)
+    
+    # Drive calls already retry inside RetryPolicy; the queue only tries again
+    # after transient failures, and gives up at once on fatal ones
+    st.session_state['upload_queue'] = UploadQueue(upload, retryable=is_retryable)
+    return st.session_state['upload_queue']
 
-def download_csv_from_drive(filename):
-    """Download CSV from Google Drive"""
-    creds = get_credentials()
-    if not creds:
-        return pd.DataFrame()
+def enqueue_csv_upload(df, filename, frame=None, properties=None, new_file=False, delete_after=()):
+    """Queue a DataFrame for background upload to Google Drive"""
+    queue = get_upload_queue()
+    if queue is None:
+        return False
     
-    try:
-        service = get_drive_service(creds)
-        files = list_files_in_folder()
-        file = next((f for f in files if f['name'] == filename), None)
-        
-        if not file:
-            return pd.DataFrame()
-        
-        def download():
-            request = service.files().get_media(fileId=file['id'])
-            file_content = io.BytesIO()
-            downloader = MediaIoBaseDownload(file_content, request)
-            
-            done = False
-            while not done:
-                status, done = downloader.next_chunk()
-            
-            file_content.seek(0)
-            return pd.read_csv(file_content)
-        
-        return retry_api_call(download)
-        
-    except:
-        return pd.DataFrame()
+    # Resolve the file id now so the worker updates it instead of creating a duplicate.
+    # frame is what a reload sees until the upload lands (a segment's whole table).
+    if not new_file:
+        find_file(filename)
+    payload = (serialize(df, filename), properties, tuple(delete_after), None)
+    queue.enqueue(filename, (df if frame is None else frame).copy(), payload)
+    return True
+
+def cancel_upload(filename):
+    """Drop a queued or failed upload that has not reached Drive"""
+    queue = st.session_state.get('upload_queue')
+    if queue is not None:
+        queue.cancel(filename)
+
+def pending_upload_names():
+    """Get names of files with queued or failed uploads"""
+    queue = st.session_state.get('upload_queue')
+    if queue is None:
+        return []
+    
+    status = queue.status()
+    return list(status['failed']) + status['pending']
+
+def pending_upload_frames():
+    """Get frames queued for upload that Drive does not have yet, by filename"""
+    queue = st.session_state.get('upload_queue')
+    if queue is None:
+        return {}
+    
+    frames = {}
+    # Oldest first, so the newest snapshot of a table wins
+    for filename in pending_upload_names():
+        frame = queue.latest_frame(filename)
+        if frame is not None:
+            frames[filename] = frame.copy()
+    return frames
+
+def completed_uploads():
+    """Number of queued uploads that have reached Drive in this session"""
+    queue = st.session_state.get('upload_queue')
+    return queue.completed if queue else 0
+
+def upload_status_sidebar():
+    """Show Drive health and pending/failed background uploads in the sidebar"""
+    retry_status = get_retry_status()
+    if retry_status['state'] != 'closed':
+        st.sidebar.warning(f"⚠️ Google Drive is not responding; retrying in {retry_status['retry_in']:.0f}s")
+    elif retry_status['retries']:
+        st.sidebar.caption(f"🔁 Drive calls retried: {retry_status['retries']}, failed: {retry_status['failures']}")
+    
+    queue = st.session_state.get('upload_queue')
+    if queue is None:
+        return
+    
+    status = queue.status()
+    if status['pending']:
+        st.sidebar.caption(f"☁️ Syncing {len(status['pending'])} file(s) to Drive...")
+    if status['failed']:
+        st.sidebar.error(f"⚠️ Upload failed: {', '.join(status['failed'])}")
+        if st.sidebar.button("🔁 Retry Upload", key="retry_upload_btn"):
+            queue.retry_failed()
+            st.rerun()
+
+def fetch_bytes(service, file_id):
+    """Download a Drive file's content by id"""
+    request = service.files().get_media(fileId=file_id)
+    file_content = io.BytesIO()
+    downloader = MediaIoBaseDownload(file_content, request)
+    
+    done = False
+    while not done:
+        status, done = downloader.next_chunk()
+    
+    return file_content.getvalue()
+
+def fetch_data(creds_data, file):
+    """Content of a Drive file, downloaded only if the local mirror is out of date"""
+    data = read_mirror(file)
+    if data is None:
+        with drive_service(creds_data) as service:
+            data = retry_api_call(lambda: fetch_bytes(service, file['id']))
+        write_mirror(file, data)
+    return data
+
+def fetch_frame(creds_data, file):
+    """Read a Drive file as a DataFrame"""
+    return deserialize(fetch_data(creds_data, file), file['name'])
+
+def read_app_json(filename, session_key, fresh=False):
+    """A JSON object kept in the app folder; fresh re-reads it from Drive instead of this session's copy"""
+    if not fresh and session_key in st.session_state:
+        return dict(st.session_state[session_key])
+    
+    folder_id = get_or_create_app_folder()
+    if not folder_id:
+        raise ConnectionError("the Google Drive app folder could not be opened")
+    
+    # Looked up directly: the folder index may not have seen another terminal's update yet
+    creds_data = st.session_state['credentials']
+    query = f"name='{filename}' and '{folder_id}' in parents and trashed=false"
+    with drive_service(creds_data) as service:
+        files = retry_api_call(lambda: service.files().list(q=query, fields=f"files({FILE_FIELDS})").execute())['files']
+    value = {}
+    if files:
+        update_folder_index(files[0])
+        value = json.loads(fetch_data(creds_data, files[0]))
+    st.session_state[session_key] = value
+    return dict(value)
+
+def write_app_json(filename, session_key, value):
+    """Store a JSON object in the app folder right away, bypassing the upload queue"""
+    folder_id = get_or_create_app_folder()
+    if not folder_id:
+        raise ConnectionError("the Google Drive app folder could not be opened")
+    
+    data = json.dumps(value, sort_keys=True).encode('utf-8')
+    with drive_service(st.session_state['credentials']) as service:
+        file = store_file(service, folder_id, filename, data, find_file(filename), mimetype='application/json')
+    update_folder_index(file)
+    st.session_state[session_key] = dict(value)
+
+def read_counters(fresh=False):
+    """Named counters kept in the app folder"""
+    return read_app_json(COUNTERS_FILE, 'drive_counters', fresh)
+
+def write_counters(counters):
+    """Store named counters right away (a number must be stored before it is used)"""
+    write_app_json(COUNTERS_FILE, 'drive_counters', counters)
+
+def journal_file(entry_id):
+    """App-folder file of one write journal entry"""
+    return f"{JOURNAL_PREFIX}{re.sub(r'[^A-Za-z0-9_-]', '_', entry_id)}.json"
+
+def read_journal():
+    """Open write journal entries: the app folder's entry files with this session's queued changes"""
+    journal = {}
+    creds_data = st.session_state['credentials']
+    for name, file in folder_index_snapshot().items():
+        if name.startswith(JOURNAL_PREFIX) and name.endswith('.json'):
+            record = json.loads(fetch_data(creds_data, file))
+            journal[record['id']] = record['entry']
+    for entry_id, entry in st.session_state.get('drive_journal', {}).items():
+        if entry is None:
+            journal.pop(entry_id, None)
+        else:
+            journal[entry_id] = entry
+    return journal
+
+def queue_journal_entry(entry_id, entry):
+    """Queue writing (or, for None, deleting) a journal entry's file
+
+    The queue uploads in order, so an entry lands before the table writes
+    queued after it and Drive never has an invoice's tables without its entry.
+    """
+    queue = get_upload_queue()
+    if queue is None:
+        raise ConnectionError("the Google Drive app folder could not be opened")
+    st.session_state.setdefault('drive_journal', {})[entry_id] = entry
+    data = None if entry is None else json.dumps({'id': entry_id, 'entry': entry}).encode('utf-8')
+    queue.enqueue(journal_file(entry_id), None, (data, None, (), 'application/json'))
+
+def download_csvs_from_drive(filenames, max_workers=DOWNLOAD_WORKERS):
+    """Download several stored tables concurrently, returning {filename: DataFrame}"""
+    if 'credentials' not in st.session_state:
+        return {filename: pd.DataFrame() for filename in filenames}
+    
+    # Worker threads have no script context, so resolve file metadata here
+    creds_data = dict(st.session_state['credentials'])
+    files = {filename: find_file(filename) for filename in filenames}
+    timings = {}
+    
+    def download(filename):
+        # Failures are raised: an empty frame here could be saved back over the real table
+        start = time.perf_counter()
+        file = files[filename]
+        try:
+            if not file:
+                return pd.DataFrame()
+            return fetch_frame(creds_data, file)
+        finally:
+            timings[filename] = time.perf_counter() - start
+    
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(filenames)))) as pool:
+        frames = dict(zip(filenames, pool.map(download, filenames)))
+    
+    st.session_state['download_timings'] = timings
+    return frames
+
+def get_download_timings():
+    """Get per-file seconds spent in the last parallel download"""
+    return st.session_state.get('download_timings', {})
@@ -0,0 +1,235 @@
+# invoice_commit.py - a new or edited invoice's rows in every table, saved as one journaled step
+import json
+import time
+import uuid
+import numpy as np
+import pandas as pd
+import streamlit as st
+from data_utils import StockMovements, fill_id_blocks, financial_year, new_ids, partition_file, save_csv_to_drive, stored_partition
+from repository import Repository
+from storage_backend import get_backend
+from table_schema import apply_schema, table_columns
+
+# Tables an invoice writes
+INVOICE_TABLES = ('bills.csv', 'bill_items.csv', 'products.csv', 'batches.csv', 'stock_movements.csv')
+# Another terminal's entry is only finished once it is this old: its own
+# writes may still be on their way to storage
+JOURNAL_STALE_SECONDS = 600
+
+
+def terminal_id():
+    """Id of this session, marking the journal entries it wrote"""
+    return st.session_state.setdefault('terminal_id', uuid.uuid4().hex)
+
+
+def _records(df):
+    """Rows of a frame as plain JSON values"""
+    return json.loads(df.to_json(orient='records'))
+
+
+def _stock_changes(repo, sold, reference, notes):
+    """Movements and stock and batch quantities (before and after) for net quantities sold
+
+    sold holds product_id, batch_no and qty per line; a negative qty is stock
+    coming back.
+    """
+    products = repo['products.csv'][['id', 'stock']]
+    sold = sold[sold['product_id'].isin(products['id'])]
+    stock = sold.groupby('product_id', as_index=False)['qty'].sum().merge(products, left_on='product_id', right_on='id')
+    stock = stock.assign(old=stock['stock'], new=(stock['stock'] - stock['qty']).clip(lower=0))
+
+    batches = repo['batches.csv'][['id', 'product_id', 'batch_no', 'quantity']].drop_duplicates(['product_id', 'batch_no'])
+    picked = sold[sold['batch_no'] != ''].groupby(['product_id', 'batch_no'], as_index=False)['qty'].sum()
+    picked = picked.astype({'product_id': batches['product_id'].dtype}).merge(batches, on=['product_id', 'batch_no'])
+    picked = picked.assign(old=picked['quantity'], new=(picked['quantity'] - picked['qty']).clip(lower=0))
+
+    movements = StockMovements(repo)
+    movements.add_rows(sold.assign(
+        movement_type=np.where(sold['qty'] > 0, "OUT", "IN"), quantity=sold['qty'].abs(), reference=reference, notes=notes
+    ))
+    return {
+        'movements': _records(movements.rows()),
+        'stock': _records(stock[['id', 'old', 'new']]),
+        'batches': _records(picked[['id', 'old', 'new']]),
+    }
+
+
+def invoice_entry(repo, bill, lines, notes):
+    """Journal entry of a new invoice
+
+    Holds the bill (given a new id), its items and stock movements, and the
+    stock and batch quantities before and after the sale.
+    """
+    bill_no = bill['bill_no']
+    lines = pd.DataFrame(lines)
+    lines['batch_no'] = lines['batch_no'].fillna('').astype(str)
+    # Ids of the bill and its movements, taken in at most one counter update
+    fill_id_blocks({'bills.csv': (repo['bills.csv'], 1), 'stock_movements.csv': (repo['stock_movements.csv'], len(lines))})
+    bill = _records(pd.DataFrame([dict(bill, id=new_ids(repo['bills.csv'], 'bills.csv'))]))[0]
+    items = lines.assign(bill_no=bill_no)[table_columns('bill_items.csv')]
+
+    return {
+        'owner': terminal_id(),
+        'time': time.time(),
+        'bill': bill,
+        'items': _records(items),
+        **_stock_changes(repo, lines, bill_no, notes),
+    }
+
+
+def item_changes(repo, old_items, new_items):
+    """Net change in quantity sold per product and batch between two item sets of a bill
+
+    Only changed (product, batch) pairs are returned, with product_id, product,
+    batch_no and qty (negative where less is sold now). Items of products no
+    longer in the catalog are left out.
+    """
+    key = ['product', 'batch_no']
+    old, new = (
+        items[key + ['qty']].assign(batch_no=items['batch_no'].fillna('').astype(str),
+                                    qty=pd.to_numeric(items['qty'], errors='coerce').fillna(0))
+        .groupby(key)['qty'].sum()
+        for items in (pd.DataFrame(old_items, columns=key + ['qty']), pd.DataFrame(new_items, columns=key + ['qty']))
+    )
+    delta = new.sub(old, fill_value=0)
+    delta = delta[delta != 0].reset_index()
+    names = repo['products.csv'][['id', 'name']].drop_duplicates('name')
+    delta = delta.merge(names, left_on='product', right_on='name')
+    return delta.rename(columns={'id': 'product_id'})[['product_id', 'product', 'batch_no', 'qty']]
+
+
+def edit_entry(repo, bill_no, values, items, notes):
+    """Journal entry of an edit to a saved invoice
+
+    Holds the bill's changed values (and what they were), its new items, and
+    stock movements and quantities for only the net change in each product
+    and batch sold.
+    """
+    old_items = repo.find('bill_items.csv', 'bill_no', bill_no)
+    bill = repo.get('bills.csv', 'bill_no', bill_no)
+    values = dict(values, fy=bill['fy'])
+    items = apply_schema(pd.DataFrame(items).assign(bill_no=bill_no), 'bill_items.csv')
+
+    return {
+        'owner': terminal_id(),
+        'time': time.time(),
+        'bill': _records(pd.DataFrame([dict(values, bill_no=bill_no)]))[0],
+        'before': _records(pd.DataFrame([bill[list(values)]]))[0],
+        'items': _records(items[table_columns('bill_items.csv')]),
+        **_stock_changes(repo, item_changes(repo, old_items, items), bill_no, notes),
+    }
+
+
+def bill_tables(repo, fy, load=stored_partition):
+    """Repository holding the bills and items of financial year fy
+
+    An older year is not in repo (only this year is loaded), so its
+    partitions are read on their own through load(filename, fy) (by default
+    fresh from storage) and saved back to that year.
+    """
+    if fy == financial_year():
+        return repo
+    return Repository(
+        lambda tables: {filename: load(filename, fy) for filename in tables},
+        save=lambda df, filename: save_csv_to_drive(df, partition_file(filename, fy)),
+    )
+
+
+def _apply_edit(bills, entry):
+    """Apply a journaled edit's bill values and items unless the bill has been changed since; True if applied"""
+    bill_no = entry['bill']['bill_no']
+    row = bills.get('bills.csv', 'bill_no', bill_no)
+    if row is None:
+        return False
+    values = {column: value for column, value in entry['bill'].items() if column != 'bill_no'}
+    current = _records(pd.DataFrame([row[list(values)]]))[0]
+    if current == entry['before']:
+        bills.update('bills.csv', 'bill_no', bill_no, **values)
+    elif current != values:
+        return False
+    bills.replace('bill_items.csv', 'bill_no', bill_no, entry['items'])
+    return True
+
+
+def apply_entry(repo, entry):
+    """Apply the parts of a journal entry the tables do not have yet, returning the repository of its bill"""
+    bill_no = entry['bill']['bill_no']
+    bills = bill_tables(repo, entry['bill'].get('fy') or financial_year())
+    if 'before' in entry:
+        # A later edit of the bill also counted the stock from this one's items
+        if not _apply_edit(bills, entry):
+            return bills
+    else:
+        if bills.get('bills.csv', 'bill_no', bill_no) is None:
+            bills.insert('bills.csv', entry['bill'])
+        if entry['items'] and bills.find('bill_items.csv', 'bill_no', bill_no).empty:
+            bills.insert('bill_items.csv', entry['items'])
+    movements = [row for row in entry['movements'] if repo.get('stock_movements.csv', 'id', row['id']) is None]
+    # Movements are saved after stock and batches, so once they are stored the
+    # quantities are too (even if they have since come back to the old values)
+    if not movements:
+        return bills
+    repo.insert('stock_movements.csv', movements)
+
+    for filename, column, changes in (('products.csv', 'stock', entry['stock']), ('batches.csv', 'quantity', entry['batches'])):
+        for change in changes:
+            row = repo.get(filename, 'id', change['id'])
+            # Left alone once it differs from what the invoice started from
+            if row is not None and row[column] == change['old']:
+                repo.update(filename, 'id', change['id'], **{column: change['new']})
+    return bills
+
+
+def save_entry(repo, entry_id, bills):
+    """Save an applied entry's tables (bills: the repository of its bill), dropping the entry once nothing is left to land"""
+    backend = get_backend()
+    bills.save('bills.csv', 'bill_items.csv')
+    repo.save(*INVOICE_TABLES)
+    # Queued Drive uploads keep the entry until finish_journal sees them landed
+    if not backend.pending_names():
+        backend.clear_journal(entry_id)
+
+
+def commit_invoice(repo, sequence, bill, lines, notes):
+    """Save a new invoice's bill, items, stock and batch quantities and movements as one step
+
+    The whole invoice is journaled before any table changes. If that fails the
+    bill number goes back to the sequence; once journaled, a save cut short is
+    finished by finish_journal on a later load.
+    """
+    backend = get_backend()
+    bill_no = bill['bill_no']
+    try:
+        entry = invoice_entry(repo, bill, lines, notes)
+        backend.write_journal(bill_no, entry)
+    except Exception:
+        sequence.release(bill_no)
+        raise
+    sequence.commit(bill_no)
+
+    save_entry(repo, bill_no, apply_entry(repo, entry))
+
+
+def commit_invoice_edit(repo, bill_no, values, items, notes):
+    """Save an edit to a saved invoice with its net stock changes as one step
+
+    values are the bill's new column values and items its new item rows. Only
+    (product, batch) pairs whose quantity changed get a movement and a stock
+    and batch update, so no full recount is needed.
+    """
+    entry_id = f"{bill_no}:edit:{uuid.uuid4().hex[:8]}"
+    entry = edit_entry(repo, bill_no, values, items, notes)
+    get_backend().write_journal(entry_id, entry)
+    save_entry(repo, entry_id, apply_entry(repo, entry))
+
+
+def finish_journal(repo):
+    """Finish journaled invoices: this session's once its writes have landed, other terminals' once stale"""
+    backend = get_backend()
+    journal = backend.journal()
+    if not journal or backend.pending_names():
+        return
+    for entry_id, entry in journal.items():
+        if entry['owner'] != terminal_id() and time.time() - entry['time'] < JOURNAL_STALE_SECONDS:
+            continue
+        save_entry(repo, entry_id, apply_entry(repo, entry))
@@ -0,0 +1,81 @@
+# invoice_sequence.py - per-financial-year invoice numbers kept in a storage counter
+import re
+import numpy as np
+
+
+def invoice_no(fy, number):
+    """Invoice number text, e.g. INV/2025-2026/7"""
+    return f"INV/{fy}/{number}"
+
+
+def invoice_number(bill_no, fy):
+    """Sequence number of one of a financial year's invoice numbers, or None"""
+    match = re.fullmatch(rf"INV/{re.escape(fy)}/(\d+)", str(bill_no).strip())
+    return int(match.group(1)) if match else None
+
+
+class InvoiceSequence:
+    """Invoice numbers of one financial year
+
+    reserve() takes the next number for a bill that is being created; commit()
+    it once the bill is saved, or release() it if the bill is abandoned. A
+    released number is handed out again only if no later one was taken.
+    """
+
+    def __init__(self, backend, fy):
+        self.backend = backend
+        self.fy = fy
+        self.counter = f"invoice/{fy}"
+        self._reserved = set()
+
+    def start_after(self, bills):
+        """Start a new counter after the highest number already on a bill of this year"""
+        if self.backend.counter(self.counter):
+            return
+        numbers = self._numbers(bills)
+        if len(numbers):
+            self.backend.take_counter(self.counter, count=0, floor=int(numbers.max()))
+
+    def peek(self):
+        """Number the next reserve() will hand out, unless another terminal takes it first"""
+        return invoice_no(self.fy, self.backend.counter(self.counter) + 1)
+
+    def reserve(self, bills):
+        """Take the next number, skipping any already on a bill"""
+        while True:
+            number = self.backend.take_counter(self.counter)
+            bill_no = invoice_no(self.fy, number)
+            if not (bills['bill_no'] == bill_no).any():
+                self._reserved.add(bill_no)
+                return bill_no
+
+    def claim(self, bill_no):
+        """Use a number typed in by hand, moving the counter past it so it is not handed out again"""
+        number = invoice_number(bill_no, self.fy)
+        if number is not None:
+            self.backend.take_counter(self.counter, count=0, floor=number)
+        return bill_no
+
+    def commit(self, bill_no):
+        """Keep a reserved number: its bill has been saved"""
+        self._reserved.discard(bill_no)
+
+    def release(self, bill_no):
+        """Give back a reserved number whose bill was not saved"""
+        if bill_no in self._reserved:
+            self._reserved.discard(bill_no)
+            self.backend.return_counter(self.counter, invoice_number(bill_no, self.fy))
+
+    def audit(self, bills):
+        """(numbers skipped, invoice numbers used by more than one bill) among this year's bills"""
+        bill_nos = bills.loc[bills['fy'] == self.fy, 'bill_no'].astype(str)
+        duplicates = sorted(bill_nos[bill_nos.duplicated()].unique())
+        numbers = self._numbers(bills)
+        last = max(self.backend.counter(self.counter), int(numbers.max()) if len(numbers) else 0)
+        gaps = np.setdiff1d(np.arange(1, last + 1), numbers).tolist()
+        return gaps, duplicates
+
+    def _numbers(self, bills):
+        bill_nos = bills.loc[bills['fy'] == self.fy, 'bill_no'].astype(str)
+        numbers = bill_nos.str.extract(rf"^INV/{re.escape(self.fy)}/(\d+)$", expand=False)
+        return numbers.dropna().astype(int).to_numpy()
@@ -0,0 +1,150 @@
+# local_storage.py - storage backend on a local directory (shop terminal / offline testing)
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+import pandas as pd
+from storage_backend import StorageBackend, StorageError
+from storage_formats import serialize, deserialize
+
+PROPERTIES_FILE = ".properties.json"
+COUNTERS_FILE = ".counters.json"
+COUNTERS_LOCK = ".counters.lock"
+JOURNAL_FILE = ".journal.json"
+LOCK_STALE_SECONDS = 10
+
+
+class LocalBackend(StorageBackend):
+    """Tables stored as files in a local directory; writes land immediately"""
+
+    label = "local disk"
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._timings = {}
+
+    def _path(self, name):
+        return os.path.join(self.root, name)
+
+    def _read_properties(self):
+        try:
+            with open(self._path(PROPERTIES_FILE), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_atomic(self, name, data):
+        path = self._path(name)
+        with open(path + ".tmp", "wb") as f:
+            f.write(data)
+        os.replace(path + ".tmp", path)
+
+    def _describe(self, name, stat, properties):
+        return {
+            'id': name,
+            'name': name,
+            'modifiedTime': datetime.fromtimestamp(stat.st_mtime, timezone.utc).isoformat(),
+            'size': str(stat.st_size),
+            'appProperties': properties.get(name, {}),
+        }
+
+    def list(self, refresh=False):
+        properties = self._read_properties()
+        files = {}
+        for entry in os.scandir(self.root):
+            if entry.is_file() and not entry.name.startswith('.') and not entry.name.endswith('.tmp'):
+                files[entry.name] = self._describe(entry.name, entry.stat(), properties)
+        return files
+
+    def metadata(self, name):
+        try:
+            stat = os.stat(self._path(name))
+        except OSError:
+            return None
+        return self._describe(name, stat, self._read_properties())
+
+    def get(self, names):
+        frames = {}
+        timings = {}
+        for name in names:
+            start = time.perf_counter()
+            try:
+                with open(self._path(name), "rb") as f:
+                    frames[name] = deserialize(f.read(), name)
+            except FileNotFoundError:
+                frames[name] = pd.DataFrame()
+            except (OSError, ValueError) as e:
+                raise StorageError(f"{name}: {e}") from e
+            timings[name] = time.perf_counter() - start
+        self._timings = timings
+        return frames
+
+    def put(self, df, name, frame=None, properties=None, new_file=False, delete_after=()):
+        with self._lock:
+            self._write_atomic(name, serialize(df, name))
+
+            stored = self._read_properties()
+            if properties:
+                stored[name] = properties
+            for old_name in delete_after:
+                stored.pop(old_name, None)
+                if os.path.exists(self._path(old_name)):
+                    os.remove(self._path(old_name))
+            self._write_atomic(PROPERTIES_FILE, json.dumps(stored, indent=1).encode('utf-8'))
+
+            self._generation += 1
+        return True
+
+    def write_generation(self):
+        return self._generation
+
+    def load_timings(self):
+        return self._timings
+
+    @contextmanager
+    def _counter_lock(self):
+        # A lock file, so terminals sharing the directory also take turns
+        path = self._path(COUNTERS_LOCK)
+        while True:
+            try:
+                fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                break
+            except FileExistsError:
+                try:
+                    # Left behind by a process that died holding it
+                    if time.time() - os.path.getmtime(path) > LOCK_STALE_SECONDS:
+                        os.remove(path)
+                except OSError:
+                    pass
+                time.sleep(0.01)
+        try:
+            yield
+        finally:
+            os.close(fd)
+            os.remove(path)
+
+    def _read_json(self, name):
+        try:
+            with open(self._path(name), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            raise StorageError(f"{name}: {e}") from e
+
+    def _read_counters(self, fresh=False):
+        return self._read_json(COUNTERS_FILE)
+
+    def _write_counters(self, counters):
+        self._write_atomic(COUNTERS_FILE, json.dumps(counters, indent=1).encode('utf-8'))
+
+    def _read_journal(self, fresh=False):
+        return self._read_json(JOURNAL_FILE)
+
+    def _write_journal(self, journal):
+        self._write_atomic(JOURNAL_FILE, json.dumps(journal, indent=1).encode('utf-8'))
@@ -0,0 +1,116 @@
+# repository.py - the loaded tables with hash indexes for the tabs' lookups
+import numpy as np
+import pandas as pd
+from data_utils import load_group, save_csv_to_drive
+from table_schema import apply_schema
+
+# Settings are saved on their own by save_settings
+SAVED_TABLES = ('company.csv', 'customers.csv', 'products.csv', 'bills.csv', 'bill_items.csv',
+                'batches.csv', 'stock_movements.csv')
+
+
+def _group_positions(df, column, offset=0):
+    """{key: row positions} of a frame grouped by a column or column tuple"""
+    if df.empty:
+        return {}
+    by = list(column) if isinstance(column, tuple) else column
+    return {key: positions + offset for key, positions in df.groupby(by, sort=False).indices.items()}
+
+
+class Repository:
+    """The tables (keyed by file name) with hash indexes on their key columns
+
+    A table is loaded the first time it is used, through load(tables) (see
+    data_utils.open_tables). insert, update, replace and delete change a table
+    and keep its indexes in step; save() writes the tables that changed,
+    through save(df, filename).
+    """
+
+    def __init__(self, load, save=save_csv_to_drive):
+        self._load = load
+        self._save = save
+        self._tables = {}
+        self._indexes = {}
+
+    def __getitem__(self, filename):
+        if filename not in self._tables:
+            self._tables.update(self._load(load_group(filename)))
+        return self._tables[filename]
+
+    def _index(self, filename, column):
+        key = (filename, column)
+        if key not in self._indexes:
+            self._indexes[key] = _group_positions(self[filename], column)
+        return self._indexes[key]
+
+    def _drop_indexes(self, filename):
+        for key in [key for key in self._indexes if key[0] == filename]:
+            del self._indexes[key]
+
+    def find(self, filename, column, value):
+        """Rows where column == value (a tuple of values for a column tuple)"""
+        df = self[filename]
+        positions = self._index(filename, column).get(value)
+        return df.iloc[positions] if positions is not None else df.iloc[0:0]
+
+    def get(self, filename, column, value):
+        """First row where column == value, or None"""
+        positions = self._index(filename, column).get(value)
+        return None if positions is None else self._tables[filename].iloc[positions[0]]
+
+    def insert(self, filename, rows):
+        """Append rows (a dict, a list of dicts or a DataFrame)"""
+        if isinstance(rows, dict):
+            rows = [rows]
+        rows = pd.DataFrame(rows)
+        df = self[filename]
+        start = len(df)
+        df = apply_schema(pd.concat([df, rows], ignore_index=True) if start else rows.reset_index(drop=True), filename)
+        self._tables[filename] = df
+
+        added = df.iloc[start:]
+        for (name, column), index in self._indexes.items():
+            if name != filename:
+                continue
+            for key, positions in _group_positions(added, column, start).items():
+                index[key] = np.concatenate([index[key], positions]) if key in index else positions
+
+    def update(self, filename, column, value, **values):
+        """Set columns of the rows where column == value"""
+        positions = self._index(filename, column).get(value)
+        if positions is None:
+            return
+        df = self._tables[filename]
+        for name, new_value in values.items():
+            try:
+                df.iloc[positions, df.columns.get_loc(name)] = new_value
+            except (TypeError, ValueError):
+                # Not of the column's dtype (a fraction in an int32 count):
+                # set it on a plain copy and let the schema type the column
+                column = df[name].astype(object)
+                column.iloc[positions] = new_value
+                df[name] = column
+                df = self._tables[filename] = apply_schema(df, filename)
+        keys = [column for name, column in self._indexes if name == filename]
+        if any(set(key if isinstance(key, tuple) else (key,)) & set(values) for key in keys):
+            self._drop_indexes(filename)
+
+    def delete(self, filename, column, value):
+        """Remove the rows where column == value"""
+        positions = self._index(filename, column).get(value)
+        if positions is None:
+            return
+        df = self._tables[filename]
+        self._tables[filename] = df.drop(df.index[positions]).reset_index(drop=True)
+        self._drop_indexes(filename)
+
+    def replace(self, filename, column, value, rows):
+        """Swap the rows where column == value for new rows"""
+        self.delete(filename, column, value)
+        self.insert(filename, rows)
+
+    def save(self, *filenames):
+        """Save the given tables, or all loaded ones (unchanged ones are skipped by save_csv_to_drive)"""
+        for filename in filenames or SAVED_TABLES:
+            if filename in self._tables:
+                self._save(self._tables[filename], filename)
@@ -0,0 +1,142 @@
+# retry_policy.py - retries with backoff and a circuit breaker for Drive API calls
+import random
+import ssl
+import threading
+import time
+from email.utils import parsedate_to_datetime
+import httplib2
+from google.auth.exceptions import TransportError
+from googleapiclient.errors import HttpError
+
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+RATE_LIMIT_REASONS = {'rateLimitExceeded', 'userRateLimitExceeded'}
+TRANSIENT_ERRORS = (TimeoutError, ConnectionError, ssl.SSLError, httplib2.HttpLib2Error, TransportError)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the API while the circuit breaker is open"""
+
+
+def is_retryable(error):
+    """Check whether an API error is transient (rate limits, 5xx, timeouts, dropped connections)"""
+    if isinstance(error, HttpError):
+        status = error.resp.status
+        if status in RETRYABLE_STATUS:
+            return True
+        if status == 403:
+            error._get_reason()  # fills error_details
+            details = error.error_details if isinstance(error.error_details, list) else []
+            return any(detail.get('reason') in RATE_LIMIT_REASONS for detail in details if isinstance(detail, dict))
+        return False
+    return isinstance(error, TRANSIENT_ERRORS)
+
+
+def retry_after(error):
+    """Seconds the server asked us to wait (Retry-After header), or None"""
+    if not isinstance(error, HttpError):
+        return None
+    value = error.resp.get('retry-after')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryPolicy:
+    """Retries transient errors with exponential backoff and full jitter, behind a circuit breaker
+
+    After failure_threshold calls in a row fail, the breaker opens and calls fail
+    fast with CircuitOpenError for reset_seconds. After that one call at a time
+    may try again; the first success closes the breaker.
+    """
+
+    def __init__(self, max_attempts=4, base_delay=0.5, max_delay=10,
+                 failure_threshold=5, reset_seconds=30, sleep=time.sleep):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._failures_in_row = 0
+        self._opened_at = None
+        self._trial_running = False
+        self._stats = {'calls': 0, 'retries': 0, 'failures': 0, 'rejected': 0, 'trips': 0}
+
+    def delay(self, attempt, error):
+        """Seconds to wait before retry number attempt + 1"""
+        wait = retry_after(error)
+        if wait is None:
+            wait = random.uniform(0, self.base_delay * 2 ** attempt)
+        return min(wait, self.max_delay)
+
+    def call(self, func):
+        """Run func, retrying transient errors; raises the last error when out of attempts"""
+        trial = self._admit()
+        try:
+            for attempt in range(self.max_attempts):
+                try:
+                    result = func()
+                except Exception as e:
+                    if not is_retryable(e):
+                        # The API answered, so this says nothing about its health
+                        self._record(success=True, failed=True)
+                        raise
+                    if attempt == self.max_attempts - 1:
+                        self._record(success=False, failed=True)
+                        raise
+                    with self._lock:
+                        self._stats['retries'] += 1
+                    self._sleep(self.delay(attempt, e))
+                else:
+                    self._record(success=True, failed=False)
+                    return result
+        finally:
+            if trial:
+                with self._lock:
+                    self._trial_running = False
+
+    def _admit(self):
+        """Let a call through, or raise CircuitOpenError; True for the trial call of a half-open breaker"""
+        with self._lock:
+            self._stats['calls'] += 1
+            if self._opened_at is None:
+                return False
+            waited = time.monotonic() - self._opened_at
+            if waited >= self.reset_seconds and not self._trial_running:
+                self._trial_running = True
+                return True
+            self._stats['rejected'] += 1
+            raise CircuitOpenError(f"Google Drive is not responding; retrying in {max(0, self.reset_seconds - waited):.0f}s")
+
+    def _record(self, success, failed):
+        with self._lock:
+            if failed:
+                self._stats['failures'] += 1
+            if success:
+                self._failures_in_row = 0
+                self._opened_at = None
+                return
+            self._failures_in_row += 1
+            if self._opened_at is not None or self._failures_in_row >= self.failure_threshold:
+                if self._opened_at is None:
+                    self._stats['trips'] += 1
+                self._opened_at = time.monotonic()
+
+    def status(self):
+        """Breaker state ('closed', 'open', 'half-open'), seconds until a retry, and call counters"""
+        with self._lock:
+            status = dict(self._stats)
+            if self._opened_at is None:
+                status.update(state='closed', retry_in=0)
+            else:
+                remaining = self.reset_seconds - (time.monotonic() - self._opened_at)
+                status.update(state='open' if remaining > 0 else 'half-open', retry_in=max(0, remaining))
+            return status
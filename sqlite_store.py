@@ -0,0 +1,292 @@
+# sqlite_store.py - SQLite storage backend with indexed tables
+import json
+import sqlite3
+import streamlit as st
+import threading
+import time
+from contextlib import closing
+from datetime import datetime, timezone
+import pandas as pd
+from storage_backend import StorageBackend, StorageError
+from storage_formats import split_ext, stored_name
+
+# Column types are only affinities in SQLite; ids are real primary keys so
+# lookups by id never scan.
+SCHEMA = {
+    'customers': "id INTEGER PRIMARY KEY, name TEXT, phone TEXT, gstin TEXT, address TEXT, place TEXT, "
+                 "ship_name TEXT, ship_address TEXT, ship_phone TEXT, ship_gstin TEXT",
+    'products': "id INTEGER PRIMARY KEY, name TEXT, hsn TEXT, price REAL, gst REAL, stock REAL, "
+                "mfg TEXT, exp TEXT, free REAL, discount REAL",
+    'bills': "id INTEGER PRIMARY KEY, bill_no TEXT, fy TEXT, customer_id INTEGER, bill_date TEXT, "
+             "subtotal REAL, cgst REAL, sgst REAL, igst REAL, grand_total REAL, payment_status TEXT, _part TEXT",
+    'bill_items': "bill_no TEXT, product TEXT, qty REAL, price REAL, gst REAL, mfg TEXT, exp TEXT, "
+                  "free REAL, discount REAL, batch_no TEXT, _part TEXT",
+    'company': "name TEXT, gstin TEXT, msme TEXT, fssai TEXT, phone TEXT, address TEXT",
+    'settings': "logo_path TEXT, upi_id TEXT",
+    'batches': "id INTEGER PRIMARY KEY, product_id INTEGER, batch_no TEXT, mfg_date TEXT, exp_date TEXT, "
+               "quantity REAL, price REAL",
+    'stock_movements': "id INTEGER PRIMARY KEY, product_id INTEGER, batch_no TEXT, movement_type TEXT, "
+                       "quantity REAL, date TEXT, reference TEXT, notes TEXT",
+}
+
+INDEXES = [
+    ('bills', 'bill_no'),
+    ('bills', 'customer_id'),
+    ('bills', 'fy'),
+    ('bill_items', 'bill_no'),
+    ('bill_items', 'batch_no'),
+    ('batches', 'product_id'),
+    ('batches', 'batch_no'),
+    ('stock_movements', 'product_id'),
+    ('stock_movements', 'batch_no'),
+    ('bills', '_part'),
+    ('bill_items', '_part'),
+]
+
+# Per-financial-year files ("bills.2025-2026") share one table, told apart by _part
+PARTITIONED_TABLES = ('bills', 'bill_items')
+
+
+def _key_for_name(name):
+    """(table, partition) a stored file name maps to (delta segments append to theirs)"""
+    stem = split_ext(name)[0].split('.delta.')[0]
+    table, _, part = stem.partition('.')
+    if table not in SCHEMA or (part and table not in PARTITIONED_TABLES):
+        return None, None
+    return table, part or None
+
+
+def _meta_name(table, part):
+    return f"{table}.{part}" if part else table
+
+
+def _part_filter(table, part):
+    """WHERE clause for one partition's rows (the unpartitioned ones when part is None)"""
+    if table not in PARTITIONED_TABLES:
+        return "1", ()
+    if part is None:
+        return "_part IS NULL", ()
+    return "_part = ?", (part,)
+
+
+def _sql_value(value):
+    """Convert a pandas cell to something sqlite3 can bind"""
+    if value is None or (not isinstance(value, (list, dict)) and pd.isna(value)):
+        return None
+    if isinstance(value, (int, float, str, bytes)):
+        return value
+    if isinstance(value, pd.Timestamp):
+        # Dates are stored as the same YYYY-MM-DD text CSV files hold
+        return value.strftime('%Y-%m-%d') if value == value.normalize() else value.isoformat()
+    if hasattr(value, 'item'):
+        return value.item()
+    return str(value)
+
+
+class SqliteBackend(StorageBackend):
+    """All tables in one SQLite database; writes are transactional and land immediately"""
+
+    label = "SQLite"
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._timings = {}
+        self._last_error = None
+        with closing(self._connect()) as conn, conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS _meta (name TEXT PRIMARY KEY, properties TEXT, modified TEXT)")
+            conn.execute("CREATE TABLE IF NOT EXISTS _counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS _journal (id TEXT PRIMARY KEY, entry TEXT NOT NULL)")
+            for table, columns in SCHEMA.items():
+                conn.execute(f"CREATE TABLE IF NOT EXISTS {table} ({columns})")
+            for table in PARTITIONED_TABLES:
+                self._ensure_columns(conn, table, ['_part'])
+            for table, column in INDEXES:
+                conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_{column} ON {table} ({column})")
+
+    def _connect(self):
+        # One short-lived connection per call: Streamlit sessions run on different threads
+        return sqlite3.connect(self.path, timeout=30)
+
+    def _describe(self, key, properties, modified):
+        name = stored_name(f"{key}.csv")
+        return {
+            'id': key,
+            'name': name,
+            'modifiedTime': modified,
+            'appProperties': json.loads(properties) if properties else {},
+        }
+
+    def list(self, refresh=False):
+        with closing(self._connect()) as conn:
+            rows = conn.execute("SELECT name, properties, modified FROM _meta").fetchall()
+        files = {}
+        for key, properties, modified in rows:
+            file = self._describe(key, properties, modified)
+            files[file['name']] = file
+        return files
+
+    def metadata(self, name):
+        key = _meta_name(*_key_for_name(name))
+        if key is None or stored_name(f"{key}.csv") != name:
+            return None
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT properties, modified FROM _meta WHERE name = ?", (key,)).fetchone()
+        return self._describe(key, *row) if row else None
+
+    def get(self, names):
+        try:
+            return self._get(names)
+        except sqlite3.Error as e:
+            raise StorageError(f"SQLite: {e}") from e
+
+    def _get(self, names):
+        frames = {}
+        timings = {}
+        with closing(self._connect()) as conn:
+            for name in names:
+                start = time.perf_counter()
+                table, part = _key_for_name(name)
+                if table is None:
+                    frames[name] = pd.DataFrame()
+                else:
+                    where, params = _part_filter(table, part)
+                    df = pd.read_sql_query(f"SELECT * FROM {table} WHERE {where} ORDER BY rowid", conn, params=params)
+                    frames[name] = df.drop(columns='_part', errors='ignore')
+                timings[name] = time.perf_counter() - start
+        self._timings = timings
+        return frames
+
+    def _ensure_columns(self, conn, table, columns):
+        existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+        for column in columns:
+            if column not in existing:
+                conn.execute(f'ALTER TABLE {table} ADD COLUMN "{column}"')
+
+    def put(self, df, name, frame=None, properties=None, new_file=False, delete_after=()):
+        # Base files replace the table (or partition), delta segments append to it.
+        # delete_after only matters for other tables or partitions, e.g. the
+        # unpartitioned bills once they have been split by financial year.
+        table, part = _key_for_name(name)
+        if table is None:
+            return False
+
+        append = '.delta.' in name
+        columns = [str(col) for col in df.columns] + (['_part'] if part else [])
+        placeholders = ", ".join("?" for _ in columns)
+        column_sql = ", ".join(f'"{col}"' for col in columns)
+        extra = (part,) if part else ()
+        rows = [tuple(_sql_value(v) for v in row) + extra
+                for row in df.astype(object).itertuples(index=False, name=None)]
+        where, params = _part_filter(table, part)
+        modified = datetime.now(timezone.utc).isoformat()
+
+        with self._lock, closing(self._connect()) as conn:
+            try:
+                with conn:  # one transaction: commit on success, roll back on any error
+                    self._ensure_columns(conn, table, columns)
+                    if not append:
+                        conn.execute(f"DELETE FROM {table} WHERE {where}", params)
+                    if part and 'id' in columns:
+                        # Rows split out of the unpartitioned table move instead of colliding on id
+                        ids = [(row[columns.index('id')],) for row in rows]
+                        conn.executemany(f"DELETE FROM {table} WHERE _part IS NULL AND id = ?", ids)
+                    if rows:
+                        conn.executemany(f"INSERT INTO {table} ({column_sql}) VALUES ({placeholders})", rows)
+                    conn.execute(
+                        "INSERT INTO _meta (name, properties, modified) VALUES (?, ?, ?) "
+                        "ON CONFLICT(name) DO UPDATE SET modified = excluded.modified, "
+                        "properties = COALESCE(excluded.properties, _meta.properties)",
+                        (_meta_name(table, part), json.dumps(properties) if properties else None, modified)
+                    )
+                    for old_name in delete_after:
+                        old_table, old_part = _key_for_name(old_name)
+                        if old_table is None or '.delta.' in old_name or (old_table, old_part) == (table, part):
+                            continue
+                        old_where, old_params = _part_filter(old_table, old_part)
+                        conn.execute(f"DELETE FROM {old_table} WHERE {old_where}", old_params)
+                        conn.execute("DELETE FROM _meta WHERE name = ?", (_meta_name(old_table, old_part),))
+            except sqlite3.Error as e:
+                self._last_error = f"{name}: {e}"
+                return False
+            self._last_error = None
+            self._generation += 1
+        return True
+
+    def write_generation(self):
+        return self._generation
+
+    def load_timings(self):
+        return self._timings
+
+    def status_sidebar(self):
+        if self._last_error:
+            st.sidebar.error(f"⚠️ Save failed: {self._last_error}")
+
+    def counter(self, name):
+        try:
+            with closing(self._connect()) as conn:
+                row = conn.execute("SELECT value FROM _counters WHERE name = ?", (name,)).fetchone()
+        except sqlite3.Error as e:
+            raise StorageError(f"SQLite: {e}") from e
+        return row[0] if row else 0
+
+    def take_counters(self, takes):
+        # The first statement takes the database's write lock, so other
+        # processes wait until this transaction has read and moved the counters
+        taken = {}
+        try:
+            with closing(self._connect()) as conn, conn:
+                for name, (count, floor) in takes.items():
+                    conn.execute("INSERT INTO _counters (name, value) VALUES (?, 0) ON CONFLICT(name) DO NOTHING", (name,))
+                    conn.execute("UPDATE _counters SET value = MAX(value, ?) + ? WHERE name = ?", (floor, count, name))
+                    last = conn.execute("SELECT value FROM _counters WHERE name = ?", (name,)).fetchone()[0]
+                    taken[name] = last - count + 1
+        except sqlite3.Error as e:
+            raise StorageError(f"SQLite: {e}") from e
+        return taken
+
+    def return_counter(self, name, first, count=1):
+        try:
+            with closing(self._connect()) as conn, conn:
+                cursor = conn.execute("UPDATE _counters SET value = ? WHERE name = ? AND value = ?",
+                                      (first - 1, name, first + count - 1))
+        except sqlite3.Error as e:
+            raise StorageError(f"SQLite: {e}") from e
+        return cursor.rowcount == 1
+
+    def journal(self):
+        try:
+            with closing(self._connect()) as conn:
+                rows = conn.execute("SELECT id, entry FROM _journal").fetchall()
+        except sqlite3.Error as e:
+            raise StorageError(f"SQLite: {e}") from e
+        return {entry_id: json.loads(entry) for entry_id, entry in rows}
+
+    def write_journal(self, entry_id, entry):
+        try:
+            with closing(self._connect()) as conn, conn:
+                conn.execute("INSERT OR REPLACE INTO _journal (id, entry) VALUES (?, ?)", (entry_id, json.dumps(entry)))
+        except sqlite3.Error as e:
+            raise StorageError(f"SQLite: {e}") from e
+
+    def clear_journal(self, entry_id):
+        try:
+            with closing(self._connect()) as conn, conn:
+                conn.execute("DELETE FROM _journal WHERE id = ?", (entry_id,))
+        except sqlite3.Error as e:
+            raise StorageError(f"SQLite: {e}") from e
+
+    def lookup(self, filename, column, value):
+        """Rows of a table (or of one partition) where column == value, using the table's index"""
+        table, part = _key_for_name(filename)
+        if table is None:
+            return None
+        where, params = _part_filter(table, part) if part else ("1", ())
+        value = _sql_value(value)
+        with closing(self._connect()) as conn:
+            df = pd.read_sql_query(f'SELECT * FROM {table} WHERE {where} AND "{column}" = ? ORDER BY rowid',
+                                   conn, params=params + (value,))
+        return df.drop(columns='_part', errors='ignore')
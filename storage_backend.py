@@ -0,0 +1,248 @@
+# storage_backend.py - where tables are stored, selected by config
+import threading
+import gdrive_storage
+from storage_config import get_storage_setting
+
+LOCAL_DIR = "data/store"
+SQLITE_PATH = "data/moofu.db"
+
+
+class StorageError(Exception):
+    """Stored data could not be listed or read (never reported as an empty table)"""
+
+
+class StorageBackend:
+    """Interface data_utils uses to list, read and write stored table files"""
+
+    label = "storage"
+
+    def login(self):
+        """Render any sign-in UI; True once the backend is usable"""
+        return True
+
+    def list(self, refresh=False):
+        """Get {name: metadata} for every stored file"""
+        raise NotImplementedError
+
+    def metadata(self, name):
+        """Get a stored file's metadata (id, name, modifiedTime, appProperties), or None"""
+        raise NotImplementedError
+
+    def changes(self, force=False):
+        """Names of stored files changed by anyone since the last call, or None if unknown
+
+        The first call reports every file. Backends that cannot tell return None
+        and are reloaded in full when their cached load expires.
+        """
+        return None
+
+    def get(self, names):
+        """Read stored files as DataFrames, returning {name: DataFrame} (empty if missing)
+
+        Raises StorageError if a file exists but cannot be read.
+        """
+        raise NotImplementedError
+
+    def put(self, df, name, frame=None, properties=None, new_file=False, delete_after=()):
+        """Store a DataFrame under name, then delete the files in delete_after; True if accepted
+
+        frame is what a reload should see until the write lands (defaults to df),
+        new_file marks names that cannot exist yet.
+        """
+        raise NotImplementedError
+
+    def cancel(self, name):
+        """Drop a write of name that has not landed yet"""
+
+    def pending_names(self):
+        """Names of files with writes that have not landed yet, oldest first"""
+        return []
+
+    def pending_frames(self):
+        """Frames of writes that have not landed yet, by name"""
+        return {}
+
+    def write_generation(self):
+        """Counter that changes whenever a write lands (cached loads are stale after it)"""
+        return 0
+
+    def load_timings(self):
+        """Seconds spent reading each file in the last load"""
+        return {}
+
+    def status_sidebar(self):
+        """Show pending/failed writes in the sidebar"""
+
+    def lookup(self, filename, column, value):
+        """Rows of a table where column == value from an index, or None if unsupported"""
+        return None
+
+    # Named counters (invoice numbers, ...). Backends keep them next to the
+    # tables; take_counter is atomic for every session sharing the storage.
+
+    def counter(self, name):
+        """Last value taken from a named counter (0 if none was)"""
+        return self._read_counters().get(name, 0)
+
+    def take_counter(self, name, count=1, floor=0):
+        """Take the next count values of a counter, all above floor, returning the first
+
+        count=0 only raises the counter to floor.
+        """
+        return self.take_counters({name: (count, floor)})[name]
+
+    def take_counters(self, takes):
+        """Take values of several counters in one update, {name: (count, floor)} -> {name: first}"""
+        with self._counter_lock():
+            counters = self._read_counters(fresh=True)
+            taken = {}
+            for name, (count, floor) in takes.items():
+                taken[name] = max(counters.get(name, 0), floor) + 1
+                counters[name] = taken[name] + count - 1
+            self._write_counters(counters)
+        return taken
+
+    def return_counter(self, name, first, count=1):
+        """Give back values from take_counter unless later ones were taken since; True if given back"""
+        with self._counter_lock():
+            counters = self._read_counters(fresh=True)
+            if counters.get(name, 0) != first + count - 1:
+                return False
+            counters[name] = first - 1
+            self._write_counters(counters)
+        return True
+
+    # Journal of writes spanning several tables (an invoice's bill, items,
+    # stock and movements). An entry is kept until all its tables are saved,
+    # so a save cut short can be finished by a later load.
+
+    def journal(self):
+        """Open journal entries, {entry id: entry}"""
+        return self._read_journal()
+
+    def write_journal(self, entry_id, entry):
+        """Store a journal entry right away"""
+        with self._counter_lock():
+            journal = self._read_journal(fresh=True)
+            journal[entry_id] = entry
+            self._write_journal(journal)
+
+    def clear_journal(self, entry_id):
+        """Drop a journal entry whose tables are all saved"""
+        with self._counter_lock():
+            journal = self._read_journal(fresh=True)
+            if journal.pop(entry_id, None) is not None:
+                self._write_journal(journal)
+
+    def _counter_lock(self):
+        return _counters_lock
+
+    def _read_counters(self, fresh=False):
+        # Default: counters and the journal only live as long as the process
+        return dict(_counters)
+
+    def _write_counters(self, counters):
+        _counters.clear()
+        _counters.update(counters)
+
+    def _read_journal(self, fresh=False):
+        return dict(_journal)
+
+    def _write_journal(self, journal):
+        _journal.clear()
+        _journal.update(journal)
+
+
+_counters_lock = threading.Lock()
+_counters = {}
+_journal = {}
+
+
+def _drive_read(func):
+    """Run a Drive call, reporting any failure as StorageError"""
+    try:
+        return func()
+    except Exception as e:
+        raise StorageError(f"Google Drive: {e}") from e
+
+
+class DriveBackend(StorageBackend):
+    """Google Drive app folder, with write-behind uploads and a local mirror"""
+
+    label = "Google Drive"
+
+    def login(self):
+        return gdrive_storage.google_drive_login()
+
+    def list(self, refresh=False):
+        return _drive_read(lambda: gdrive_storage.folder_index_snapshot(refresh))
+
+    def metadata(self, name):
+        return _drive_read(lambda: gdrive_storage.find_file(name))
+
+    def changes(self, force=False):
+        return _drive_read(lambda: gdrive_storage.poll_changes(force))
+
+    def get(self, names):
+        return _drive_read(lambda: gdrive_storage.download_csvs_from_drive(names))
+
+    def put(self, df, name, frame=None, properties=None, new_file=False, delete_after=()):
+        return gdrive_storage.enqueue_csv_upload(df, name, frame, properties, new_file, delete_after)
+
+    def cancel(self, name):
+        gdrive_storage.cancel_upload(name)
+
+    def pending_names(self):
+        return gdrive_storage.pending_upload_names()
+
+    def pending_frames(self):
+        return gdrive_storage.pending_upload_frames()
+
+    def write_generation(self):
+        return gdrive_storage.completed_uploads()
+
+    def load_timings(self):
+        return gdrive_storage.get_download_timings()
+
+    def status_sidebar(self):
+        gdrive_storage.upload_status_sidebar()
+
+    def _counter_lock(self):
+        return gdrive_storage.counters_lock
+
+    def _read_counters(self, fresh=False):
+        return _drive_read(lambda: gdrive_storage.read_counters(fresh))
+
+    def _write_counters(self, counters):
+        _drive_read(lambda: gdrive_storage.write_counters(counters))
+
+    # One file per entry, queued ahead of the uploads of the tables it covers,
+    # so saving an invoice does not wait for Drive
+
+    def journal(self):
+        return _drive_read(gdrive_storage.read_journal)
+
+    def write_journal(self, entry_id, entry):
+        gdrive_storage.queue_journal_entry(entry_id, entry)
+
+    def clear_journal(self, entry_id):
+        gdrive_storage.queue_journal_entry(entry_id, None)
+
+
+_backends = {}
+
+
+def get_backend():
+    """Get the configured storage backend ([storage] backend = "drive" | "local" | "sqlite")"""
+    kind = str(get_storage_setting('backend', 'drive')).lower()
+    if kind not in _backends:
+        if kind == 'local':
+            from local_storage import LocalBackend
+            _backends[kind] = LocalBackend(get_storage_setting('local_dir', LOCAL_DIR))
+        elif kind == 'sqlite':
+            from sqlite_store import SqliteBackend
+            _backends[kind] = SqliteBackend(get_storage_setting('sqlite_path', SQLITE_PATH))
+        else:
+            _backends[kind] = DriveBackend()
+    return _backends[kind]
+
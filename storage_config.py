@@ -0,0 +1,16 @@
+# storage_config.py - storage settings from the environment or Streamlit secrets
+import os
+import streamlit as st
+
+
+def get_storage_setting(key, default=None):
+    """Read a storage setting from MOOFU_<KEY> or the [storage] section of secrets.toml"""
+    value = os.environ.get(f"MOOFU_{key.upper()}")
+    if value:
+        return value
+
+    try:
+        return st.secrets["storage"].get(key, default)
+    except Exception:
+        # No secrets file or no [storage] section
+        return default
@@ -0,0 +1,107 @@
+# storage_formats.py - serialization of tables as CSV, Parquet or Feather
+import io
+import importlib.util
+import pandas as pd
+from pandas.api.types import infer_dtype
+from storage_config import get_storage_setting
+
+DEFAULT_FORMAT = 'csv'
+
+
+def _csv_write(df):
+    # Written straight into a byte buffer, without an intermediate str
+    buffer = io.BytesIO()
+    df.to_csv(buffer, index=False, encoding='utf-8')
+    return buffer.getvalue()
+
+
+def _csv_read(data):
+    return pd.read_csv(io.BytesIO(data))
+
+
+def _arrow_safe(df):
+    """Make a frame writable by pyarrow: plain index and no mixed-type object columns"""
+    df = df.reset_index(drop=True)
+    df.columns = [str(col) for col in df.columns]
+    for col in df.columns:
+        if df[col].dtype == object and infer_dtype(df[col], skipna=True).startswith('mixed'):
+            df[col] = df[col].where(df[col].isna(), df[col].astype(str))
+    return df
+
+
+def _parquet_write(df):
+    buffer = io.BytesIO()
+    _arrow_safe(df).to_parquet(buffer, index=False)
+    return buffer.getvalue()
+
+
+def _parquet_read(data):
+    return pd.read_parquet(io.BytesIO(data))
+
+
+def _feather_write(df):
+    buffer = io.BytesIO()
+    _arrow_safe(df).to_feather(buffer)
+    return buffer.getvalue()
+
+
+def _feather_read(data):
+    return pd.read_feather(io.BytesIO(data))
+
+
+FORMATS = {
+    'csv': {'ext': '.csv', 'mimetype': 'text/csv', 'write': _csv_write, 'read': _csv_read, 'needs': None},
+    'parquet': {'ext': '.parquet', 'mimetype': 'application/vnd.apache.parquet',
+                'write': _parquet_write, 'read': _parquet_read, 'needs': 'pyarrow'},
+    'feather': {'ext': '.feather', 'mimetype': 'application/vnd.apache.arrow.file',
+                'write': _feather_write, 'read': _feather_read, 'needs': 'pyarrow'},
+}
+
+
+def format_available(fmt):
+    """Check whether a format and its optional dependency are usable"""
+    if fmt not in FORMATS:
+        return False
+    needs = FORMATS[fmt]['needs']
+    return needs is None or importlib.util.find_spec(needs) is not None
+
+
+def storage_format():
+    """Configured table format, falling back to CSV when it is unknown or unavailable"""
+    fmt = str(get_storage_setting('format', DEFAULT_FORMAT)).lower()
+    return fmt if format_available(fmt) else DEFAULT_FORMAT
+
+
+def format_for_name(name):
+    """Format of a stored file, from its extension"""
+    for fmt, spec in FORMATS.items():
+        if name.endswith(spec['ext']):
+            return fmt
+    return DEFAULT_FORMAT
+
+
+def split_ext(name):
+    """Split a stored file name into stem and known format extension"""
+    fmt = format_for_name(name)
+    ext = FORMATS[fmt]['ext']
+    return (name[:-len(ext)], ext) if name.endswith(ext) else (name, '')
+
+
+def stored_name(filename, fmt=None):
+    """File name a table is stored under in the given (default: configured) format"""
+    return split_ext(filename)[0] + FORMATS[fmt or storage_format()]['ext']
+
+
+def serialize(df, name):
+    """Serialize a frame in the format implied by the stored file name"""
+    return FORMATS[format_for_name(name)]['write'](df)
+
+
+def deserialize(data, name):
+    """Parse stored bytes in the format implied by the file name"""
+    return FORMATS[format_for_name(name)]['read'](data)
+
+
+def mimetype_for_name(name):
+    """MIME type to upload a stored file with"""
+    return FORMATS[format_for_name(name)]['mimetype']
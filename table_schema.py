@@ -0,0 +1,134 @@
+# table_schema.py - column types of every table, applied whenever a table is loaded or saved
+import pandas as pd
+from pandas.api.types import is_float_dtype, is_numeric_dtype
+
+PAYMENT_STATUSES = ["Pending", "Paid", "Partially Paid"]
+MOVEMENT_TYPES = ["IN", "OUT", "ADJUST_IN", "ADJUST_OUT", "ADJUST_SET"]
+
+# Column kinds:
+#   id       nullable int32
+#   count    int32 quantities, missing as 0 (float64 if a stored value is fractional)
+#   amount   float64 money and percentages, missing as 0
+#   text     strings, missing as ''
+#   date     datetime64[s] (kept as text if a stored value is not a date)
+#   category categorical over the listed values plus any others stored
+TABLE_SCHEMAS = {
+    'customers.csv': {
+        'id': 'id', 'name': 'text', 'phone': 'text', 'gstin': 'text', 'address': 'text', 'place': 'text',
+        'ship_name': 'text', 'ship_address': 'text', 'ship_phone': 'text', 'ship_gstin': 'text',
+    },
+    'products.csv': {
+        'id': 'id', 'name': 'text', 'hsn': 'text', 'price': 'amount', 'gst': 'amount', 'stock': 'count',
+        'mfg': 'text', 'exp': 'text', 'free': 'count', 'discount': 'amount',
+    },
+    'bills.csv': {
+        'id': 'id', 'bill_no': 'text', 'fy': ('category', []), 'customer_id': 'id', 'bill_date': 'date',
+        'subtotal': 'amount', 'cgst': 'amount', 'sgst': 'amount', 'igst': 'amount', 'grand_total': 'amount',
+        'payment_status': ('category', PAYMENT_STATUSES),
+    },
+    'bill_items.csv': {
+        'bill_no': 'text', 'product': 'text', 'qty': 'count', 'price': 'amount', 'gst': 'amount',
+        'mfg': 'text', 'exp': 'text', 'free': 'count', 'discount': 'amount', 'batch_no': 'text',
+    },
+    'company.csv': {
+        'name': 'text', 'gstin': 'text', 'msme': 'text', 'fssai': 'text', 'phone': 'text', 'address': 'text',
+    },
+    'settings.csv': {'logo_path': 'text', 'upi_id': 'text'},
+    'batches.csv': {
+        'id': 'id', 'product_id': 'id', 'batch_no': 'text', 'mfg_date': 'date', 'exp_date': 'date',
+        'quantity': 'count', 'price': 'amount',
+    },
+    'stock_movements.csv': {
+        'id': 'id', 'product_id': 'id', 'batch_no': 'text', 'movement_type': ('category', MOVEMENT_TYPES),
+        'quantity': 'count', 'date': 'date', 'reference': 'text', 'notes': 'text',
+    },
+}
+
+INT32_RANGE = (-2**31, 2**31 - 1)
+# One unit for every date column, so equal dates always hash alike
+DATE_DTYPE = 'datetime64[s]'
+
+
+def _as_text(series):
+    if is_float_dtype(series.dtype) and (series.dropna() % 1 == 0).all():
+        # Codes like batch numbers read back as 101.0 when the column has gaps
+        series = series.astype('Int64')
+    return series.astype(object).fillna('').astype(str)
+
+
+def _fits_int32(values):
+    return (values % 1 == 0).all() and values.between(*INT32_RANGE).all()
+
+
+def _convert(series, kind):
+    """Series converted to a column kind (the same object when it already has that type)"""
+    kind, categories = kind if isinstance(kind, tuple) else (kind, None)
+    dtype = series.dtype
+
+    if kind == 'text':
+        if isinstance(dtype, pd.StringDtype) and not series.hasnans:
+            return series
+        return _as_text(series)
+
+    if kind == 'id':
+        if dtype == 'Int32':
+            return series
+        values = pd.to_numeric(series, errors='coerce')
+        return values.astype('Int32') if _fits_int32(values.dropna()) else values
+
+    if kind == 'count':
+        if dtype == 'int32':
+            return series
+        values = pd.to_numeric(series, errors='coerce').fillna(0)
+        return values.astype('int32') if _fits_int32(values) else values.astype('float64')
+
+    if kind == 'amount':
+        if dtype == 'float64' and not series.hasnans:
+            return series
+        return pd.to_numeric(series, errors='coerce').fillna(0.0).astype('float64')
+
+    if kind == 'date':
+        if dtype == DATE_DTYPE:
+            return series
+        if pd.api.types.is_datetime64_dtype(dtype):
+            return series.astype(DATE_DTYPE)
+        if is_numeric_dtype(dtype) and series.notna().any():
+            return series
+        parsed = pd.to_datetime(series, format='ISO8601', errors='coerce')
+        given = series.notna() & (series.astype(object) != '')
+        # Never drop a stored value that is not a date
+        return parsed.astype(DATE_DTYPE) if not (parsed.isna() & given).any() else _as_text(series)
+
+    if kind == 'category':
+        values = series.astype(object).where(series.notna(), None)
+        stored = sorted(set(values.dropna()) - set(categories), key=str)
+        wanted = list(categories) + stored
+        if isinstance(dtype, pd.CategoricalDtype) and list(dtype.categories) == wanted:
+            return series
+        return values.astype(pd.CategoricalDtype(wanted))
+
+    raise ValueError(f"Unknown column kind: {kind}")
+
+
+def table_columns(filename):
+    """Column names of a table, in order"""
+    return list(TABLE_SCHEMAS[filename])
+
+
+def apply_schema(df, filename):
+    """Frame with every column of the table's schema, in order and of its type (extra columns kept last)"""
+    schema = TABLE_SCHEMAS[filename]
+    columns = {}
+    unchanged = list(df.columns[:len(schema)]) == list(schema)
+    for name, kind in schema.items():
+        series = df[name] if name in df.columns else pd.Series([None] * len(df), index=df.index, dtype=object)
+        columns[name] = _convert(series, kind)
+        unchanged = unchanged and columns[name] is series
+    if unchanged:
+        return df
+
+    typed = pd.DataFrame(columns, index=df.index)
+    extra = [col for col in df.columns if col not in schema]
+    if extra:
+        typed = pd.concat([typed, df[extra]], axis=1)
+    return typed
@@ -0,0 +1,59 @@
+# tax_engine.py - line and invoice tax amounts, worked out in whole paise
+import numpy as np
+import pandas as pd
+
+TAX_TYPES = ("GST", "IGST", "NO_TAX")
+AMOUNT_COLUMNS = ['taxable', 'cgst', 'sgst', 'igst', 'total']
+
+
+def _paise(values):
+    """Rupee amounts as whole paise"""
+    return np.rint(np.asarray(values, dtype='float64') * 100).astype('int64')
+
+
+def _share(amounts, basis_points, parts=1):
+    """amounts × basis_points / 10000 / parts, rounded half up to the paisa"""
+    denominator = 10000 * parts
+    return (2 * amounts * basis_points + denominator) // (2 * denominator)
+
+
+def tax_type_of(amounts):
+    """Tax type a bill (or totals) was charged with, from its cgst, sgst and igst"""
+    if amounts['igst'] > 0:
+        return "IGST"
+    if amounts['cgst'] > 0 or amounts['sgst'] > 0:
+        return "GST"
+    return "NO_TAX"
+
+
+def calculate(lines, tax_type):
+    """Amounts of invoice lines (a frame with qty, price, discount and gst columns)
+
+    Returns (a frame of each line's taxable, cgst, sgst, igst and total, the
+    invoice totals of those columns). Every line amount is rounded to the paisa
+    once, and the totals are sums of the rounded line amounts, so a preview and
+    the saved bill always agree.
+    """
+    if tax_type not in TAX_TYPES:
+        raise ValueError(f"Unknown tax type: {tax_type}")
+
+    qty = pd.to_numeric(lines['qty'], errors='coerce').fillna(0).to_numpy('float64')
+    gross = np.rint(qty * _paise(pd.to_numeric(lines['price'], errors='coerce').fillna(0))).astype('int64')
+    # Percentages in basis points, so 2.5% is exactly 250
+    discount = _paise(pd.to_numeric(lines['discount'], errors='coerce').fillna(0))
+    rate = _paise(pd.to_numeric(lines['gst'], errors='coerce').fillna(0))
+
+    taxable = gross - _share(gross, discount)
+    zero = np.zeros_like(taxable)
+    cgst = sgst = igst = zero
+    if tax_type == "GST":
+        cgst = sgst = _share(taxable, rate, parts=2)
+    elif tax_type == "IGST":
+        igst = _share(taxable, rate)
+    total = taxable + cgst + sgst + igst
+
+    paise = pd.DataFrame(
+        {'taxable': taxable, 'cgst': cgst, 'sgst': sgst, 'igst': igst, 'total': total}, index=lines.index
+    )
+    totals = {column: int(paise[column].sum()) / 100 for column in AMOUNT_COLUMNS}
+    return paise / 100, totals
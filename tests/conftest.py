@@ -0,0 +1,24 @@
+# conftest.py - lets the tests import the app's modules from the repository root, and shared fixtures
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def local_store(tmp_path, monkeypatch):
+    """A fresh local-directory store and session for one test, yielding its backend"""
+    import streamlit as st
+    import data_utils
+    import storage_backend
+
+    monkeypatch.setenv('MOOFU_BACKEND', 'local')
+    monkeypatch.setenv('MOOFU_LOCAL_DIR', str(tmp_path / 'store'))
+    storage_backend._backends.clear()
+    st.session_state.clear()
+    data_utils._load_tables_cached.clear()
+    data_utils._load_history_cached.clear()
+    yield storage_backend.get_backend()
+    storage_backend._backends.clear()
+    st.session_state.clear()
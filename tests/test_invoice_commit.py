@@ -0,0 +1,247 @@
+# test_invoice_commit.py - journaled invoices and their replay after a save cut short
+import time
+import pandas as pd
+import pytest
+from data_utils import financial_year, open_tables
+from invoice_commit import (
+    JOURNAL_STALE_SECONDS, _apply_edit, apply_entry, commit_invoice_edit, edit_entry, finish_journal,
+    invoice_entry, item_changes, save_entry,
+)
+from repository import Repository
+
+FY = financial_year()
+PRODUCTS = ['Soap', 'Oil', 'Tea', 'Rice', 'Salt']
+
+
+@pytest.fixture
+def store(local_store):
+    """The local store with five products of 50 each and batches of soap and rice"""
+    local_store.put(pd.DataFrame({'id': range(1, 6), 'name': PRODUCTS, 'stock': [50] * 5}), 'products.csv')
+    local_store.put(pd.DataFrame([
+        {'id': 1, 'product_id': 1, 'batch_no': 'B1', 'quantity': 20},
+        {'id': 2, 'product_id': 4, 'batch_no': 'B1', 'quantity': 10},
+        {'id': 3, 'product_id': 4, 'batch_no': 'B2', 'quantity': 10},
+    ]), 'batches.csv')
+    return local_store
+
+
+def load():
+    """The stored tables, as the next run of the app sees them"""
+    return Repository(open_tables())
+
+
+def line(product_id, qty, batch_no=''):
+    return {'product_id': product_id, 'product': PRODUCTS[product_id - 1], 'batch_no': batch_no, 'qty': qty,
+            'price': 10.0, 'gst': 5.0, 'free': 0, 'discount': 0.0, 'mfg': '', 'exp': ''}
+
+
+def journal_sale(store, repo, number, *lines):
+    """Journal a sale without applying it, returning (entry id, entry)"""
+    bill_no = f"INV/{FY}/{number}"
+    entry = invoice_entry(repo, {'bill_no': bill_no, 'fy': FY, 'customer_id': 1, 'grand_total': 10.0}, list(lines), "sale")
+    store.write_journal(bill_no, entry)
+    return bill_no, entry
+
+
+def stock(repo, product_id):
+    return repo.get('products.csv', 'id', product_id)['stock']
+
+
+def batch(repo, batch_id):
+    return repo.get('batches.csv', 'id', batch_id)['quantity']
+
+
+def test_sale_applies_every_table(store):
+    repo = load()
+    entry_id, entry = journal_sale(store, repo, 1, line(1, 5, 'B1'), line(2, 3))
+    save_entry(repo, entry_id, apply_entry(repo, entry))
+
+    repo = load()
+    assert repo.find('bill_items.csv', 'bill_no', entry_id)['qty'].tolist() == [5, 3]
+    assert (stock(repo, 1), stock(repo, 2), batch(repo, 1)) == (45, 47, 15)
+    assert repo['stock_movements.csv']['movement_type'].tolist() == ['OUT', 'OUT']
+    assert store.journal() == {}
+
+
+def test_replaying_an_entry_again_changes_nothing(store):
+    repo = load()
+    entry_id, entry = journal_sale(store, repo, 1, line(1, 5, 'B1'))
+    save_entry(repo, entry_id, apply_entry(repo, entry))
+    before = {filename: load()[filename].copy() for filename in ('bills.csv', 'bill_items.csv', 'products.csv',
+                                                                  'batches.csv', 'stock_movements.csv')}
+
+    repo = load()
+    save_entry(repo, entry_id, apply_entry(repo, entry))
+    repo = load()
+    for filename, df in before.items():
+        pd.testing.assert_frame_equal(repo[filename], df)
+
+
+def test_replay_finishes_a_save_cut_after_the_bill(store):
+    repo = load()
+    entry_id, entry = journal_sale(store, repo, 1, line(1, 5, 'B1'), line(4, 2, 'B2'))
+    apply_entry(repo, entry)
+    # Cut short: only the bill and its items reached storage
+    repo.save('bills.csv', 'bill_items.csv')
+
+    repo = load()
+    assert (stock(repo, 1), stock(repo, 4)) == (50, 50)
+    assert repo['stock_movements.csv'].empty
+    finish_journal(repo)
+
+    repo = load()
+    assert (stock(repo, 1), stock(repo, 4), batch(repo, 1), batch(repo, 3)) == (45, 48, 15, 8)
+    assert len(repo['stock_movements.csv']) == 2
+    assert len(repo['bills.csv']) == 1
+    assert store.journal() == {}
+
+
+def test_replay_keeps_stock_changed_since_the_invoice(store):
+    repo = load()
+    entry_id, entry = journal_sale(store, repo, 1, line(1, 5, 'B1'), line(2, 3))
+    apply_entry(repo, entry)
+    repo.save('bills.csv', 'bill_items.csv')
+
+    # A stock count after the cut, before the entry is replayed
+    repo = load()
+    repo.update('products.csv', 'id', 1, stock=30)
+    repo.save()
+    finish_journal(repo)
+
+    repo = load()
+    assert stock(repo, 1) == 30
+    assert stock(repo, 2) == 47
+    assert len(repo['stock_movements.csv']) == 2
+
+
+def test_replay_after_a_restock_does_not_deduct_again(store):
+    repo = load()
+    entry_id, entry = journal_sale(store, repo, 1, line(1, 5))
+    apply_entry(repo, entry)
+    repo.save()
+    # Back at the level the invoice started from
+    repo = load()
+    repo.update('products.csv', 'id', 1, stock=50)
+    repo.save()
+
+    finish_journal(load())
+    assert stock(load(), 1) == 50
+
+
+def test_other_terminals_recent_entries_are_left_alone(store):
+    repo = load()
+    entry_id, entry = journal_sale(store, repo, 1, line(1, 5))
+    entry = dict(entry, owner='another terminal', time=time.time())
+    store.write_journal(entry_id, entry)
+
+    finish_journal(load())
+    repo = load()
+    assert repo['bills.csv'].empty and stock(repo, 1) == 50
+    assert list(store.journal()) == [entry_id]
+
+    # Once stale, its terminal is taken to have stopped, and it is finished here
+    store.write_journal(entry_id, dict(entry, time=time.time() - JOURNAL_STALE_SECONDS - 1))
+    finish_journal(load())
+    repo = load()
+    assert len(repo['bills.csv']) == 1 and stock(repo, 1) == 45
+    assert store.journal() == {}
+
+
+def test_journal_is_cleared_once_nothing_is_pending(store, monkeypatch):
+    pending = ['products.csv']
+    monkeypatch.setattr(store, 'pending_names', lambda: list(pending))
+
+    repo = load()
+    entry_id, entry = journal_sale(store, repo, 1, line(1, 5))
+    save_entry(repo, entry_id, apply_entry(repo, entry))
+    assert list(store.journal()) == [entry_id]
+    # Not finished while writes are still on their way
+    finish_journal(load())
+    assert list(store.journal()) == [entry_id]
+
+    pending.clear()
+    finish_journal(load())
+    assert store.journal() == {}
+    repo = load()
+    assert stock(repo, 1) == 45 and len(repo['stock_movements.csv']) == 1
+
+
+def sold(store, repo, *lines):
+    """A saved sale of lines, returning its bill number"""
+    entry_id, entry = journal_sale(store, repo, 1, *lines)
+    save_entry(repo, entry_id, apply_entry(repo, entry))
+    return entry_id
+
+
+def items_of(*lines):
+    """Bill item rows of lines"""
+    return [{key: value for key, value in row.items() if key != 'product_id'} for row in lines]
+
+
+# One of each kind of change, and a line left as it was
+OLD_LINES = (line(1, 2, 'B1'), line(2, 3), line(3, 4), line(4, 5, 'B1'), line(5, 1))
+NEW_LINES = (line(1, 5, 'B1'), line(2, 1), line(4, 5, 'B2'), line(5, 1))
+
+
+def test_item_changes_are_net_per_product_and_batch(store):
+    changes = item_changes(load(), items_of(*OLD_LINES), items_of(*NEW_LINES))
+    got = sorted(zip(changes['product_id'], changes['batch_no'], changes['qty']))
+    # More soap, less oil, no tea, rice moved from batch B1 to B2, salt unchanged
+    assert got == [(1, 'B1', 3), (2, '', -2), (3, '', -4), (4, 'B1', -5), (4, 'B2', 5)]
+
+
+def test_item_changes_of_unchanged_items_are_empty(store):
+    assert item_changes(load(), items_of(*OLD_LINES), items_of(*reversed(OLD_LINES))).empty
+
+
+def test_edit_records_one_signed_movement_per_change(store):
+    repo = load()
+    bill_no = sold(store, repo, *OLD_LINES)
+    repo = load()
+    commit_invoice_edit(repo, bill_no, {'grand_total': 99.0}, items_of(*NEW_LINES), "edit")
+
+    repo = load()
+    movements = repo['stock_movements.csv']
+    edit = movements[movements['notes'] == "edit"]
+    got = sorted(zip(edit['product_id'], edit['batch_no'], edit['movement_type'], edit['quantity']))
+    assert got == [(1, 'B1', 'OUT', 3), (2, '', 'IN', 2), (3, '', 'IN', 4), (4, 'B1', 'IN', 5), (4, 'B2', 'OUT', 5)]
+    assert [stock(repo, product_id) for product_id in range(1, 6)] == [45, 49, 50, 45, 49]
+    assert (batch(repo, 1), batch(repo, 2), batch(repo, 3)) == (15, 10, 5)
+    assert repo.find('bill_items.csv', 'bill_no', bill_no)['product'].tolist() == ['Soap', 'Oil', 'Rice', 'Salt']
+    assert repo.get('bills.csv', 'bill_no', bill_no)['grand_total'] == 99.0
+
+
+def test_edit_of_a_bill_changed_since_is_not_replayed(store):
+    repo = load()
+    bill_no = sold(store, repo, line(1, 2))
+    repo = load()
+    entry = edit_entry(repo, bill_no, {'grand_total': 50.0}, items_of(line(1, 7)), "edit")
+    store.write_journal('edit', entry)
+    # Another edit lands before this one is replayed
+    repo.update('bills.csv', 'bill_no', bill_no, grand_total=20.0)
+    repo.save()
+
+    repo = load()
+    assert _apply_edit(repo, entry) is False
+    finish_journal(load())
+    repo = load()
+    assert stock(repo, 1) == 48
+    assert len(repo['stock_movements.csv']) == 1
+    assert repo.get('bills.csv', 'bill_no', bill_no)['grand_total'] == 20.0
+    assert store.journal() == {}
+
+
+def test_edit_already_applied_is_not_applied_twice(store):
+    repo = load()
+    bill_no = sold(store, repo, line(1, 2))
+    repo = load()
+    entry = edit_entry(repo, bill_no, {'grand_total': 50.0}, items_of(line(1, 7)), "edit")
+    store.write_journal('edit', entry)
+    save_entry(repo, 'edit', apply_entry(repo, entry))
+
+    repo = load()
+    save_entry(repo, 'edit', apply_entry(repo, entry))
+    repo = load()
+    assert stock(repo, 1) == 43
+    assert len(repo['stock_movements.csv']) == 2
+    assert repo.find('bill_items.csv', 'bill_no', bill_no)['qty'].tolist() == [7]
@@ -0,0 +1,100 @@
+# test_invoice_sequence.py - per-year invoice numbers kept in a storage counter
+import threading
+import pandas as pd
+from invoice_sequence import InvoiceSequence, invoice_no, invoice_number
+from storage_backend import StorageBackend
+
+FY = "2025-2026"
+
+
+class MemoryBackend(StorageBackend):
+    """Counters of one test, kept in memory"""
+
+    def __init__(self):
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    def _counter_lock(self):
+        return self.lock
+
+    def _read_counters(self, fresh=False):
+        return dict(self.counters)
+
+    def _write_counters(self, counters):
+        self.counters = dict(counters)
+
+
+def bills(*bill_nos, fy=FY):
+    return pd.DataFrame({'bill_no': list(bill_nos), 'fy': [fy] * len(bill_nos)})
+
+
+def test_invoice_number_text():
+    assert invoice_no(FY, 7) == "INV/2025-2026/7"
+    assert invoice_number("INV/2025-2026/7", FY) == 7
+    assert invoice_number(" INV/2025-2026/12 ", FY) == 12
+    assert invoice_number("INV/2024-2025/7", FY) is None
+    assert invoice_number("CASH-1", FY) is None
+
+
+def test_new_counter_starts_after_existing_bills():
+    backend = MemoryBackend()
+    sequence = InvoiceSequence(backend, FY)
+    sequence.start_after(bills("INV/2025-2026/3", "INV/2025-2026/9", "CASH-1"))
+    assert sequence.peek() == "INV/2025-2026/10"
+    assert sequence.reserve(bills()) == "INV/2025-2026/10"
+
+
+def test_existing_counter_is_kept():
+    backend = MemoryBackend()
+    backend.counters[f"invoice/{FY}"] = 20
+    InvoiceSequence(backend, FY).start_after(bills("INV/2025-2026/40"))
+    assert backend.counter(f"invoice/{FY}") == 20
+
+
+def test_reserve_skips_numbers_already_on_a_bill():
+    sequence = InvoiceSequence(MemoryBackend(), FY)
+    assert sequence.reserve(bills("INV/2025-2026/1", "INV/2025-2026/2")) == "INV/2025-2026/3"
+
+
+def test_released_number_is_reused_only_if_last():
+    sequence = InvoiceSequence(MemoryBackend(), FY)
+    first = sequence.reserve(bills())
+    sequence.release(first)
+    assert sequence.reserve(bills()) == first
+
+    second = sequence.reserve(bills())
+    third = sequence.reserve(bills())
+    sequence.release(second)
+    assert sequence.reserve(bills()) == "INV/2025-2026/4"
+    sequence.commit(third)
+    sequence.release(third)
+    assert sequence.peek() == "INV/2025-2026/5"
+
+
+def test_claimed_number_moves_the_counter():
+    sequence = InvoiceSequence(MemoryBackend(), FY)
+    sequence.claim("INV/2025-2026/15")
+    assert sequence.reserve(bills()) == "INV/2025-2026/16"
+    assert sequence.claim("CASH-1") == "CASH-1"
+    assert sequence.peek() == "INV/2025-2026/17"
+
+
+def test_audit_finds_gaps_and_duplicates():
+    backend = MemoryBackend()
+    backend.counters[f"invoice/{FY}"] = 6
+    year = bills("INV/2025-2026/1", "INV/2025-2026/2", "INV/2025-2026/2", "INV/2025-2026/5")
+    other = bills("INV/2024-2025/3", fy="2024-2025")
+    gaps, duplicates = InvoiceSequence(backend, FY).audit(pd.concat([year, other]))
+    assert gaps == [3, 4, 6]
+    assert duplicates == ["INV/2025-2026/2"]
+
+
+def test_concurrent_reserves_get_different_numbers():
+    sequence = InvoiceSequence(MemoryBackend(), FY)
+    taken = []
+    threads = [threading.Thread(target=lambda: taken.append(sequence.reserve(bills()))) for _ in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(invoice_number(bill_no, FY) for bill_no in taken) == list(range(1, 21))
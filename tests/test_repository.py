@@ -0,0 +1,125 @@
+# test_repository.py - lazily loaded tables and the hash indexes kept in step with them
+import pandas as pd
+from repository import Repository
+from table_schema import apply_schema
+
+STORED = {
+    'products.csv': [
+        {'id': 1, 'name': 'Soap', 'stock': 10},
+        {'id': 2, 'name': 'Oil', 'stock': 5},
+    ],
+    'batches.csv': [
+        {'id': 1, 'product_id': 1, 'batch_no': 'B1', 'quantity': 4},
+        {'id': 2, 'product_id': 1, 'batch_no': 'B2', 'quantity': 6},
+        {'id': 3, 'product_id': 2, 'batch_no': 'B1', 'quantity': 5},
+    ],
+    'bills.csv': [{'id': 1, 'bill_no': 'INV/1'}],
+    'bill_items.csv': [
+        {'bill_no': 'INV/1', 'product': 'Soap', 'qty': 1},
+        {'bill_no': 'INV/1', 'product': 'Oil', 'qty': 2},
+    ],
+}
+
+
+def repository():
+    """A repository over STORED, recording its loads and saves"""
+    loads, saves = [], []
+
+    def load(tables):
+        loads.append(tuple(tables))
+        return {filename: apply_schema(pd.DataFrame(STORED[filename]), filename) for filename in tables}
+
+    repo = Repository(load, save=lambda df, filename: saves.append((filename, df.copy())))
+    return repo, loads, saves
+
+
+def test_tables_load_on_first_use():
+    repo, loads, _ = repository()
+    assert loads == []
+    repo['products.csv']
+    repo['products.csv']
+    assert loads == [('products.csv',)]
+    # Bills and their items are loaded together
+    repo['bill_items.csv']
+    repo['bills.csv']
+    assert loads[1:] == [('bills.csv', 'bill_items.csv')]
+
+
+def test_find_and_get():
+    repo, _, _ = repository()
+    assert repo.find('batches.csv', 'product_id', 1)['batch_no'].tolist() == ['B1', 'B2']
+    assert repo.find('batches.csv', 'product_id', 9).empty
+    assert repo.get('products.csv', 'name', 'Oil')['id'] == 2
+    assert repo.get('products.csv', 'name', 'Tea') is None
+    assert repo.get('batches.csv', ('product_id', 'batch_no'), (2, 'B1'))['quantity'] == 5
+
+
+def test_insert_extends_built_indexes():
+    repo, _, _ = repository()
+    repo.find('batches.csv', 'product_id', 1)
+    repo.get('batches.csv', ('product_id', 'batch_no'), (1, 'B1'))
+    repo.insert('batches.csv', [
+        {'id': 4, 'product_id': 1, 'batch_no': 'B3', 'quantity': 1},
+        {'id': 5, 'product_id': 3, 'batch_no': 'B1', 'quantity': 2},
+    ])
+    assert repo.find('batches.csv', 'product_id', 1)['batch_no'].tolist() == ['B1', 'B2', 'B3']
+    assert repo.get('batches.csv', 'product_id', 3)['id'] == 5
+    assert repo.get('batches.csv', ('product_id', 'batch_no'), (1, 'B3'))['id'] == 4
+    # Inserted rows take the table's types
+    assert str(repo['batches.csv']['quantity'].dtype) == 'int32'
+
+
+def test_insert_into_empty_table():
+    repo, _, _ = repository()
+    repo.delete('bills.csv', 'bill_no', 'INV/1')
+    repo.insert('bills.csv', {'id': 2, 'bill_no': 'INV/2'})
+    assert repo.get('bills.csv', 'bill_no', 'INV/2')['id'] == 2
+
+
+def test_update_keeps_or_rebuilds_indexes():
+    repo, _, _ = repository()
+    repo.get('products.csv', 'name', 'Soap')
+    repo.update('products.csv', 'id', 1, stock=7)
+    assert repo.get('products.csv', 'name', 'Soap')['stock'] == 7
+    # Changing an indexed column rebuilds that table's indexes
+    repo.update('products.csv', 'id', 1, name='Bar Soap')
+    assert repo.get('products.csv', 'name', 'Soap') is None
+    assert repo.get('products.csv', 'name', 'Bar Soap')['id'] == 1
+    repo.update('products.csv', 'id', 99, stock=1)
+    assert repo['products.csv']['stock'].tolist() == [7, 5]
+
+
+def test_update_casts_to_the_column_type():
+    repo, _, _ = repository()
+    # JSON-decoded quantities arrive as floats
+    repo.update('products.csv', 'id', 1, stock=8.0)
+    assert str(repo['products.csv']['stock'].dtype) == 'int32'
+    repo.update('batches.csv', 'id', 2, quantity=2.5)
+    assert repo.get('batches.csv', 'id', 2)['quantity'] == 2.5
+    assert repo['batches.csv']['quantity'].tolist() == [4, 2.5, 5]
+    repo.update('products.csv', 'id', 2, stock='3')
+    assert repo['products.csv']['stock'].tolist() == [8, 3]
+    assert str(repo['products.csv']['stock'].dtype) == 'int32'
+
+
+def test_delete_and_replace():
+    repo, _, _ = repository()
+    repo.find('bill_items.csv', 'bill_no', 'INV/1')
+    repo.replace('bill_items.csv', 'bill_no', 'INV/1', [{'bill_no': 'INV/1', 'product': 'Tea', 'qty': 3}])
+    assert repo.find('bill_items.csv', 'bill_no', 'INV/1')['product'].tolist() == ['Tea']
+    repo.delete('bill_items.csv', 'bill_no', 'INV/1')
+    assert repo.find('bill_items.csv', 'bill_no', 'INV/1').empty
+    assert repo['bill_items.csv'].index.tolist() == []
+
+
+def test_save_writes_only_loaded_tables():
+    repo, _, saves = repository()
+    repo.update('products.csv', 'id', 2, stock=4)
+    repo['batches.csv']
+    repo.save()
+    assert [filename for filename, _ in saves] == ['products.csv', 'batches.csv']
+    assert saves[0][1]['stock'].tolist() == [10, 4]
+
+    saves.clear()
+    repo.save('batches.csv', 'customers.csv')
+    assert [filename for filename, _ in saves] == ['batches.csv']
@@ -0,0 +1,109 @@
+# test_retry_policy.py - backoff and circuit breaker of Drive API calls
+import httplib2
+import pytest
+from googleapiclient.errors import HttpError
+from retry_policy import CircuitOpenError, RetryPolicy, is_retryable, retry_after
+
+
+def http_error(status, headers=None):
+    resp = httplib2.Response(dict({'status': status}, **(headers or {})))
+    return HttpError(resp, b'{}')
+
+
+def failing(*errors, result="ok"):
+    """A call raising the given errors in turn, then returning result"""
+    errors = list(errors)
+    calls = []
+
+    def call():
+        calls.append(1)
+        if errors:
+            raise errors.pop(0)
+        return result
+    call.calls = calls
+    return call
+
+
+def test_transient_errors_are_retryable():
+    assert is_retryable(http_error(503))
+    assert is_retryable(http_error(429))
+    assert is_retryable(TimeoutError())
+    assert is_retryable(ConnectionError())
+    assert not is_retryable(http_error(404))
+    assert not is_retryable(http_error(400))
+    assert not is_retryable(CircuitOpenError())
+    assert not is_retryable(ValueError())
+
+
+def test_retry_after_header():
+    assert retry_after(http_error(429, {'retry-after': '3'})) == 3.0
+    assert retry_after(http_error(429)) is None
+    assert retry_after(TimeoutError()) is None
+
+
+def test_retries_transient_errors_with_backoff():
+    sleeps = []
+    policy = RetryPolicy(max_attempts=4, base_delay=1, max_delay=100, sleep=sleeps.append)
+    call = failing(TimeoutError(), http_error(503))
+    assert policy.call(call) == "ok"
+    assert len(call.calls) == 3
+    # Full jitter: each wait is at most base_delay * 2 ** attempt
+    assert len(sleeps) == 2 and 0 <= sleeps[0] <= 1 and 0 <= sleeps[1] <= 2
+    assert policy.status()['retries'] == 2
+
+
+def test_delay_is_capped_and_honours_retry_after():
+    policy = RetryPolicy(base_delay=1, max_delay=5)
+    assert policy.delay(10, TimeoutError()) <= 5
+    assert policy.delay(0, http_error(429, {'retry-after': '4'})) == 4
+    assert policy.delay(0, http_error(429, {'retry-after': '60'})) == 5
+
+
+def test_fatal_errors_are_not_retried():
+    policy = RetryPolicy(sleep=lambda seconds: None)
+    call = failing(http_error(404))
+    with pytest.raises(HttpError):
+        policy.call(call)
+    assert len(call.calls) == 1
+    # The API answered, so the breaker stays closed
+    assert policy.status()['state'] == 'closed'
+
+
+def test_gives_up_after_max_attempts():
+    policy = RetryPolicy(max_attempts=3, sleep=lambda seconds: None)
+    call = failing(*[TimeoutError()] * 5)
+    with pytest.raises(TimeoutError):
+        policy.call(call)
+    assert len(call.calls) == 3
+
+
+def test_breaker_opens_after_failures_in_a_row():
+    policy = RetryPolicy(max_attempts=1, failure_threshold=2, reset_seconds=60, sleep=lambda seconds: None)
+    for _ in range(2):
+        with pytest.raises(TimeoutError):
+            policy.call(failing(TimeoutError()))
+    assert policy.status()['state'] == 'open'
+
+    call = failing()
+    with pytest.raises(CircuitOpenError):
+        policy.call(call)
+    assert not call.calls
+    assert policy.status()['rejected'] == 1 and policy.status()['trips'] == 1
+
+
+def test_half_open_breaker_closes_on_success():
+    policy = RetryPolicy(max_attempts=1, failure_threshold=1, reset_seconds=0, sleep=lambda seconds: None)
+    with pytest.raises(TimeoutError):
+        policy.call(failing(TimeoutError()))
+    assert policy.status()['state'] == 'half-open'
+    assert policy.call(failing()) == "ok"
+    assert policy.status()['state'] == 'closed'
+
+
+def test_failed_trial_reopens_the_breaker():
+    policy = RetryPolicy(max_attempts=1, failure_threshold=1, reset_seconds=0, sleep=lambda seconds: None)
+    for _ in range(2):
+        with pytest.raises(TimeoutError):
+            policy.call(failing(TimeoutError()))
+    assert policy.status()['trips'] == 1
+    assert policy.status()['state'] != 'closed'
@@ -0,0 +1,75 @@
+# test_tax_engine.py - line and invoice tax amounts rounded to the paisa
+import pandas as pd
+import pytest
+from tax_engine import AMOUNT_COLUMNS, calculate, tax_type_of
+
+
+def lines(*rows):
+    """Invoice lines from (qty, price, discount, gst) tuples"""
+    return pd.DataFrame(rows, columns=['qty', 'price', 'discount', 'gst'])
+
+
+def test_mixed_gst_rates():
+    amounts, totals = calculate(lines((2, 50, 0, 5), (1, 200, 10, 12), (3, 33.33, 0, 18)), "GST")
+    assert amounts['taxable'].tolist() == [100.0, 180.0, 99.99]
+    assert amounts['cgst'].tolist() == [2.5, 10.8, 9.0]
+    assert amounts['sgst'].tolist() == amounts['cgst'].tolist()
+    assert amounts['igst'].tolist() == [0.0, 0.0, 0.0]
+    assert totals == {'taxable': 379.99, 'cgst': 22.3, 'sgst': 22.3, 'igst': 0.0, 'total': 424.59}
+
+
+def test_igst_versus_cgst_and_sgst():
+    items = lines((1, 10.10, 0, 5))
+    gst, gst_totals = calculate(items, "GST")
+    igst, igst_totals = calculate(items, "IGST")
+    # 25.25 paise each way rounds down; 50.5 paise of IGST rounds up
+    assert (gst.loc[0, 'cgst'], gst.loc[0, 'sgst'], gst.loc[0, 'igst']) == (0.25, 0.25, 0.0)
+    assert (igst.loc[0, 'cgst'], igst.loc[0, 'sgst'], igst.loc[0, 'igst']) == (0.0, 0.0, 0.51)
+    assert gst_totals['total'] == 10.6
+    assert igst_totals['total'] == 10.61
+
+
+def test_no_tax():
+    amounts, totals = calculate(lines((4, 2.5, 0, 18)), "NO_TAX")
+    assert amounts.loc[0, 'total'] == 10.0
+    assert totals['cgst'] == totals['sgst'] == totals['igst'] == 0.0
+
+
+def test_half_paisa_rounds_up():
+    # 10 paise at 5% is half a paisa of IGST; 1 paisa at 2.5% + 2.5% is a quarter each
+    amounts, totals = calculate(lines((1, 0.10, 0, 5), (1, 0.10, 0, 5)), "IGST")
+    assert amounts['igst'].tolist() == [0.01, 0.01]
+    assert totals['igst'] == 0.02
+
+
+def test_totals_are_sums_of_rounded_lines():
+    items = lines(*[(1, 0.10, 0, 5)] * 3, (7, 1.15, 2.5, 12), (0.5, 99.99, 0, 28))
+    for tax_type in ("GST", "IGST"):
+        amounts, totals = calculate(items, tax_type)
+        for column in AMOUNT_COLUMNS:
+            assert totals[column] == round(float(amounts[column].sum()), 2)
+        assert totals['total'] == round(totals['taxable'] + totals['cgst'] + totals['sgst'] + totals['igst'], 2)
+
+
+def test_float_prices_do_not_drift():
+    # 0.29 is 28.999999... paise as a float; prices are read as whole paise first
+    amounts, totals = calculate(lines((3, 0.29, 0, 0), (3, 19.99, 0, 0)), "GST")
+    assert amounts['taxable'].tolist() == [0.87, 59.97]
+    assert totals['taxable'] == 60.84
+
+
+def test_blank_values_count_as_zero():
+    amounts, totals = calculate(lines((None, 10, None, 18), (2, '', 0, 18)), "GST")
+    assert amounts['total'].tolist() == [0.0, 0.0]
+    assert totals['total'] == 0.0
+
+
+def test_unknown_tax_type():
+    with pytest.raises(ValueError):
+        calculate(lines((1, 1, 0, 5)), "VAT")
+
+
+def test_tax_type_of():
+    assert tax_type_of({'cgst': 0, 'sgst': 0, 'igst': 1.5}) == "IGST"
+    assert tax_type_of({'cgst': 0.5, 'sgst': 0.5, 'igst': 0}) == "GST"
+    assert tax_type_of({'cgst': 0, 'sgst': 0, 'igst': 0}) == "NO_TAX"
@@ -5,12 +5,17 @@ import os
 import base64
 from datetime import date
 from data_utils import (
-    next_invoice_no, 
+    invoice_sequence, 
     get_month_year_folder, 
     safe_str, 
-    record_stock_movement
+    format_date,
+    financial_years,
+    load_history
 )
 from pdf_generator import generate_invoice_pdf
+from tax_engine import calculate, tax_type_of
+from invoice_commit import bill_tables, commit_invoice, commit_invoice_edit, item_changes
+from table_schema import apply_schema
 
 
 # PDF Viewer Function
@@ -24,16 +29,38 @@ def show_pdf(pdf_path):
     """
     st.markdown(pdf_display, unsafe_allow_html=True)
 
+# Create Bill keeps the invoice's lines as a cart of product ids in session
+# state, so only the cart's rows get widgets however large the catalog is
+def add_to_cart():
+    """Move the product chosen in the picker into the cart"""
+    product_id = st.session_state.cart_product_picker
+    if product_id is not None and product_id not in st.session_state.cart:
+        st.session_state.cart.append(product_id)
+    st.session_state.cart_product_picker = None
+
+def remove_from_cart(product_id):
+    """Drop a product's line from the cart"""
+    st.session_state.cart.remove(product_id)
+
 # CREATE BILL TAB
-def create_bill_tab(customers, products, bills, items_df, company_df, batches_df, stock_movements_df, logo_path, upi_id):
+# Bill entry and editing are fragments: a widget change reruns only the tab,
+# with no loading or saving until the invoice is generated or saved
+@st.fragment
+def create_bill_tab(repo, logo_path, upi_id):
+    customers = repo['customers.csv']
+    products = repo['products.csv']
+    bills = repo['bills.csv']
+    company_df = repo['company.csv']
     st.header("🧾 Generate Invoice")
     
     if customers.empty or products.empty:
         st.warning("⚠️ Please add customers and products first.")
-        return customers, products, bills, items_df, company_df, batches_df, stock_movements_df
+        return
     
     if 'bill_created' not in st.session_state:
         st.session_state.bill_created = False
+    if 'cart' not in st.session_state:
+        st.session_state.cart = []
     
     if st.session_state.bill_created:
         st.success("✅ Invoice created successfully!")
@@ -54,15 +81,17 @@ def create_bill_tab(customers, products, bills, items_df, company_df, batches_df
         with col1:
             cust_id = st.selectbox("Select Customer", 
                                   customers.id, 
-                                  format_func=lambda x: customers[customers.id==x].iloc[0]['name'],
+                                  format_func=lambda x: repo.get('customers.csv', 'id', x)['name'],
                                   key="bill_customer_select")
-            customer = customers[customers.id==cust_id].iloc[0].to_dict()
+            customer = repo.get('customers.csv', 'id', cust_id).to_dict()
         
         with col2:
             bill_date = st.date_input("Invoice Date", date.today(), key="bill_date_input")
         
         with col3:
-            default_bill_no = next_invoice_no(bills)
+            # Only a preview: the number is taken when the invoice is generated
+            sequence = invoice_sequence(bills)
+            default_bill_no = sequence.peek()
             bill_no = st.text_input("Invoice No.", value=default_bill_no, key="bill_no_input")
         
         st.subheader("Tax Configuration")
@@ -82,18 +111,33 @@ def create_bill_tab(customers, products, bills, items_df, company_df, batches_df
         
         st.subheader("Add Products")
         
+        product_names = dict(zip(products['id'], products['name']))
+        st.selectbox(
+            "Search products",
+            products['id'].tolist(),
+            index=None,
+            format_func=product_names.get,
+            placeholder="Type a product name to add it",
+            on_change=add_to_cart,
+            key="cart_product_picker"
+        )
+        
         bill_items = []
+        line_totals = []
         
-        for idx, row in products.iterrows():
+        for product_id in st.session_state.cart:
+            row = repo.get('products.csv', 'id', product_id)
+            if row is None:
+                continue
             with st.container():
-                col1, col2, col3, col4, col5, col6, col7 = st.columns([3, 1.5, 1, 1, 1, 1, 1])
+                col1, col2, col3, col4, col5, col6, col7, col8 = st.columns([3, 1.5, 1, 1, 1, 1, 1, 0.5])
                 
                 with col1:
                     st.write(f"**{row['name']}** (HSN: {row.get('hsn', 'N/A')}) | Stock: {row.get('stock', 0)}")
                 
                 with col2:
                     # Get available batches for this product
-                    product_batches = batches_df[batches_df.product_id == row['id']]
+                    product_batches = repo.find('batches.csv', 'product_id', row['id'])
                     if not product_batches.empty:
                         batch_options = [""] + product_batches['batch_no'].tolist()
                         selected_batch = st.selectbox(
@@ -106,7 +150,7 @@ def create_bill_tab(customers, products, bills, items_df, company_df, batches_df
                         selected_batch = st.text_input("Batch", key=f"batch_{row['id']}", placeholder="No batch", label_visibility="collapsed")
                 
                 with col3:
-                    qty = st.number_input("Qty", min_value=0, value=0, key=f"qty_{row['id']}")
+                    qty = st.number_input("Qty", min_value=0, value=1, key=f"qty_{row['id']}")
                 
                 with col4:
                     price = st.number_input("Price", min_value=0.0, value=float(row['price']), step=0.01, key=f"price_{row['id']}")
@@ -118,87 +162,36 @@ def create_bill_tab(customers, products, bills, items_df, company_df, batches_df
                     discount = st.number_input("Disc%", min_value=0.0, max_value=100.0, value=float(row.get('discount', 0)), step=0.5, key=f"disc_{row['id']}")
                 
                 with col7:
-                    if qty > 0:
-                        subtotal = qty * price
-                        disc_amount = subtotal * discount / 100
-                        final = subtotal - disc_amount
-                        st.success(f"Rs.{final:.2f}")
+                    line_total = st.empty()
+                
+                with col8:
+                    st.button("✖", key=f"remove_{row['id']}", help="Remove from invoice",
+                              on_click=remove_from_cart, args=(product_id,))
                 
                 if qty > 0:
-                    gst_rate = float(row.get('gst', 0))
-                    subtotal = qty * price
-                    disc_amount = subtotal * discount / 100
-                    taxable = subtotal - disc_amount
-                    
-                    if tax_type == "NO_TAX":
-                        total = taxable
-                        bill_items.append({
-                            'name': row['name'],
-                            'product': row['name'],
-                            'hsn': row.get('hsn', ''),
-                            'qty': qty,
-                            'price': price,
-                            'gst': gst_rate,
-                            'mfg': row.get('mfg', ''),
-                            'exp': row.get('exp', ''),
-                            'free': free_qty,
-                            'discount': discount,
-                            'rate': price,
-                            'taxable': taxable,
-                            'cgst': 0,
-                            'sgst': 0,
-                            'igst': 0,
-                            'total': total,
-                            'batch_no': selected_batch,
-                            'product_id': row['id']
-                        })
-                    elif tax_type == "IGST":
-                        igst_amount = (taxable * gst_rate) / 100
-                        total = taxable + igst_amount
-                        bill_items.append({
-                            'name': row['name'],
-                            'product': row['name'],
-                            'hsn': row.get('hsn', ''),
-                            'qty': qty,
-                            'price': price,
-                            'gst': gst_rate,
-                            'mfg': row.get('mfg', ''),
-                            'exp': row.get('exp', ''),
-                            'free': free_qty,
-                            'discount': discount,
-                            'rate': price,
-                            'taxable': taxable,
-                            'cgst': 0,
-                            'sgst': 0,
-                            'igst': igst_amount,
-                            'total': total,
-                            'batch_no': selected_batch,
-                            'product_id': row['id']
-                        })
-                    else:  # GST
-                        cgst_amount = (taxable * gst_rate) / 200
-                        sgst_amount = (taxable * gst_rate) / 200
-                        total = taxable + cgst_amount + sgst_amount
-                        bill_items.append({
-                            'name': row['name'],
-                            'product': row['name'],
-                            'hsn': row.get('hsn', ''),
-                            'qty': qty,
-                            'price': price,
-                            'gst': gst_rate,
-                            'mfg': row.get('mfg', ''),
-                            'exp': row.get('exp', ''),
-                            'free': free_qty,
-                            'discount': discount,
-                            'rate': price,
-                            'taxable': taxable,
-                            'cgst': cgst_amount,
-                            'sgst': sgst_amount,
-                            'igst': 0,
-                            'total': total,
-                            'batch_no': selected_batch,
-                            'product_id': row['id']
-                        })
+                    line_totals.append(line_total)
+                    bill_items.append({
+                        'name': row['name'],
+                        'product': row['name'],
+                        'hsn': row.get('hsn', ''),
+                        'qty': qty,
+                        'price': price,
+                        'gst': float(row.get('gst', 0)),
+                        'mfg': row.get('mfg', ''),
+                        'exp': row.get('exp', ''),
+                        'free': free_qty,
+                        'discount': discount,
+                        'rate': price,
+                        'batch_no': selected_batch,
+                        'product_id': row['id']
+                    })
+        
+        if bill_items:
+            lines = pd.DataFrame(bill_items)
+            amounts, totals = calculate(lines, tax_type)
+            bill_items = pd.concat([lines, amounts], axis=1).to_dict('records')
+            for line_total, taxable in zip(line_totals, amounts['taxable']):
+                line_total.success(f"Rs.{taxable:.2f}")
         
         st.divider()
         
@@ -219,11 +212,11 @@ def create_bill_tab(customers, products, bills, items_df, company_df, batches_df
             st.dataframe(summary_df[display_cols], width='stretch')
             
             # Totals
-            total_taxable = sum(item['taxable'] for item in bill_items)
-            total_cgst = sum(item['cgst'] for item in bill_items)
-            total_sgst = sum(item['sgst'] for item in bill_items)
-            total_igst = sum(item['igst'] for item in bill_items)
-            grand_total = sum(item['total'] for item in bill_items)
+            total_taxable = totals['taxable']
+            total_cgst = totals['cgst']
+            total_sgst = totals['sgst']
+            total_igst = totals['igst']
+            grand_total = totals['total']
             
             col1, col2, col3 = st.columns(3)
             
@@ -261,77 +254,22 @@ def create_bill_tab(customers, products, bills, items_df, company_df, batches_df
             if st.button("🎯 Generate Invoice PDF", type="primary", key="generate_invoice_btn"):
                 if not company_df.loc[0]['name'] or pd.isna(company_df.loc[0]['name']):
                     st.error("⚠️ Please configure company details first!")
+                elif bill_no != default_bill_no and repo.get('bills.csv', 'bill_no', bill_no) is not None:
+                    st.error(f"⚠️ Invoice number {bill_no} is already used.")
                 else:
-                    # Save bill
-                    new_bill_id = 1 if bills.empty else int(bills.id.max()) + 1
+                    bill_no = sequence.reserve(bills) if bill_no == default_bill_no else sequence.claim(bill_no)
                     from data_utils import financial_year
-                    fy = financial_year()
-                    
-                    new_bill = pd.DataFrame([[
-                        new_bill_id, bill_no, fy, cust_id, str(bill_date),
-                        total_taxable, total_cgst, total_sgst, total_igst,
-                        grand_total, payment_status
-                    ]], columns=['id','bill_no','fy','customer_id','bill_date',
-                               'subtotal','cgst','sgst','igst','grand_total','payment_status'])
-                    
-                    bills = pd.concat([bills, new_bill], ignore_index=True)
-                    save_csv(bills, BILLS_FILE)
-                    
-                    # Save items
-                    for item in bill_items:
-                        new_item = {
-                        'bill_no': bill_no,
-                        'product': item['name'],
-                        'qty': item['qty'],
-                        'price': item['price'],
-                        'gst': item['gst'],
-                        'mfg': item['mfg'],
-                        'exp': item['exp'],
-                        'free': item['free'],
-                        'discount': item['discount'],
-                        'batch_no': item.get('batch_no', '')
-                        }
-                        items_df = pd.concat([items_df, pd.DataFrame([new_item])], ignore_index=True)
-
-                    
-                    save_csv(items_df, ITEMS_FILE)
-                    
-                    # Update stock and record movements
-                    for item in bill_items:
-                        prod_idx = products[products['name'] == item['name']].index
-                        if not prod_idx.empty:
-                            product_id = products.loc[prod_idx[0], 'id']
-                            current_stock = products.loc[prod_idx[0], 'stock']
-                            new_stock = max(0, current_stock - item['qty'])
-                            products.loc[prod_idx[0], 'stock'] = new_stock
-                            
-                            # Record stock movement
-                            stock_movements_df = record_stock_movement(
-                                stock_movements_df, 
-                                product_id, 
-                                item.get('batch_no', 'N/A'), 
-                                "OUT", 
-                                item['qty'], 
-                                bill_no, 
-                                f"Sale to {customer['name']}"
-                            )
-                            
-                            # Update batch quantity if batch was selected
-                            if item.get('batch_no'):
-                                batch_idx = batches_df[
-                                    (batches_df.product_id == product_id) & 
-                                    (batches_df.batch_no == item['batch_no'])
-                                ].index
-                                if not batch_idx.empty:
-                                    current_batch_qty = batches_df.loc[batch_idx[0], 'quantity']
-                                    batches_df.loc[batch_idx[0], 'quantity'] = max(0, current_batch_qty - item['qty'])
-                    
-                    save_csv(products, PRODUCTS_FILE)
-                    save_csv(batches_df, BATCHES_FILE)
-                    save_csv(stock_movements_df, STOCK_MOVEMENTS_FILE)
+                    new_bill = {
+                        'bill_no': bill_no, 'fy': financial_year(), 'customer_id': cust_id,
+                        'bill_date': str(bill_date), 'subtotal': total_taxable, 'cgst': total_cgst,
+                        'sgst': total_sgst, 'igst': total_igst, 'grand_total': grand_total,
+                        'payment_status': payment_status
+                    }
+                    # Bill, items, stock, batches and movements are saved together
+                    commit_invoice(repo, sequence, new_bill, bill_items, f"Sale to {customer['name']}")
                     
                     # Generate PDF
-                    customer_name = customers[customers.id == cust_id].iloc[0]['name']
+                    customer_name = customer['name']
                     folder_path = get_month_year_folder(bill_date, customer_name)
                     os.makedirs(folder_path, exist_ok=True)
                     
@@ -371,16 +309,20 @@ def create_bill_tab(customers, products, bills, items_df, company_df, batches_df
                     )
                     
                     st.session_state.bill_created = True
+                    st.session_state.cart = []
                     st.rerun()
         else:
             st.info("Add products to generate invoice")
-    
-    return customers, products, bills, items_df, company_df, batches_df, stock_movements_df
 
 # VIEW BILL TAB - WITH PDF VIEWER
-def view_bill_tab(bills, items_df, customers):
+def view_bill_tab(repo):
     st.header("👁️ View Invoice")
     
+    # Earlier years are read (and cached) only when picked here
+    fy = st.selectbox("Financial Year", financial_years(), key="view_fy_select")
+    bill_repo = bill_tables(repo, fy, load=lambda filename, fy: load_history(filename, [fy]))
+    bills = bill_repo['bills.csv']
+    
     if bills.empty:
         st.info("No bills available to view.")
         return
@@ -392,9 +334,9 @@ def view_bill_tab(bills, items_df, customers):
     )
     
     if selected_bill_no:
-        bill_data = bills[bills.bill_no == selected_bill_no].iloc[0]
-        bill_items_data = items_df[items_df.bill_no == selected_bill_no]
-        customer_info = customers[customers.id == bill_data['customer_id']].iloc[0]
+        bill_data = bill_repo.get('bills.csv', 'bill_no', selected_bill_no)
+        bill_items_data = bill_repo.find('bill_items.csv', 'bill_no', selected_bill_no)
+        customer_info = repo.get('customers.csv', 'id', bill_data['customer_id'])
         
         st.subheader(f"Invoice: {selected_bill_no}")
         
@@ -404,7 +346,7 @@ def view_bill_tab(bills, items_df, customers):
         with col1:
             st.metric("Customer", customer_info['name'])
         with col2:
-            st.metric("Date", bill_data['bill_date'])
+            st.metric("Date", format_date(bill_data['bill_date']))
         with col3:
             st.metric("Total", f"₹{bill_data['grand_total']:.2f}")
         with col4:
@@ -465,12 +407,15 @@ def view_bill_tab(bills, items_df, customers):
 # EDIT BILL TAB - FULLY EDITABLE
 # Replace the edit_bill_tab function in ui_billing.py with this corrected version:
 
-def edit_bill_tab(bills, items_df, customers, products, company_df, batches_df, stock_movements_df, logo_path, upi_id):
+@st.fragment
+def edit_bill_tab(repo, logo_path, upi_id):
+    bills = repo['bills.csv']
+    company_df = repo['company.csv']
     st.header("✏️ Edit Invoice")
     
     if bills.empty:
         st.info("No bills available to edit.")
-        return bills, items_df, products, batches_df, stock_movements_df
+        return
     
     selected_bill_no = st.selectbox(
         "Select Invoice to Edit",
@@ -479,9 +424,9 @@ def edit_bill_tab(bills, items_df, customers, products, company_df, batches_df,
     )
     
     if selected_bill_no:
-        bill_data = bills[bills.bill_no == selected_bill_no].iloc[0]
-        bill_items_data = items_df[items_df.bill_no == selected_bill_no].copy()
-        customer_info = customers[customers.id == bill_data['customer_id']].iloc[0]
+        bill_data = repo.get('bills.csv', 'bill_no', selected_bill_no)
+        bill_items_data = repo.find('bill_items.csv', 'bill_no', selected_bill_no).copy()
+        customer_info = repo.get('customers.csv', 'id', bill_data['customer_id'])
         
         st.subheader(f"Editing Invoice: {selected_bill_no}")
         
@@ -489,7 +434,7 @@ def edit_bill_tab(bills, items_df, customers, products, company_df, batches_df,
         
         with col1:
             st.write(f"**Customer:** {customer_info['name']}")
-            st.write(f"**Date:** {bill_data['bill_date']}")
+            st.write(f"**Date:** {format_date(bill_data['bill_date'])}")
         
         with col2:
             st.write(f"**Current Total:** ₹{bill_data['grand_total']:.2f}")
@@ -504,23 +449,6 @@ def edit_bill_tab(bills, items_df, customers, products, company_df, batches_df,
         st.subheader("Edit Bill Items")
         st.info("💡 You can edit quantities, prices, discounts, and batch numbers below. Add/remove rows as needed.")
         
-        # Ensure batch_no column exists
-        if 'batch_no' not in bill_items_data.columns:
-            bill_items_data['batch_no'] = ''
-        
-        # FIXED: Convert mfg, exp, batch_no to string to avoid float/text type conflicts
-        bill_items_data['mfg'] = bill_items_data['mfg'].fillna('').astype(str)
-        bill_items_data['exp'] = bill_items_data['exp'].fillna('').astype(str)
-        bill_items_data['batch_no'] = bill_items_data['batch_no'].fillna('').astype(str)
-        bill_items_data['product'] = bill_items_data['product'].fillna('').astype(str)
-        
-        # Convert numeric columns to proper types
-        bill_items_data['qty'] = pd.to_numeric(bill_items_data['qty'], errors='coerce').fillna(0)
-        bill_items_data['price'] = pd.to_numeric(bill_items_data['price'], errors='coerce').fillna(0.0)
-        bill_items_data['gst'] = pd.to_numeric(bill_items_data['gst'], errors='coerce').fillna(0.0)
-        bill_items_data['free'] = pd.to_numeric(bill_items_data['free'], errors='coerce').fillna(0)
-        bill_items_data['discount'] = pd.to_numeric(bill_items_data['discount'], errors='coerce').fillna(0.0)
-        
         # EDITABLE DATAFRAME using st.data_editor
         edited_items = st.data_editor(
             bill_items_data,
@@ -541,57 +469,27 @@ def edit_bill_tab(bills, items_df, customers, products, company_df, batches_df,
             },
             hide_index=True
         )
+        # Rows added in the editor come back with blank cells
+        edited_items = apply_schema(edited_items, 'bill_items.csv')
         
         st.divider()
         
         # Preview recalculated totals
         st.subheader("Updated Totals Preview")
         
-        preview_subtotal = 0
-        preview_cgst = 0
-        preview_sgst = 0
-        preview_igst = 0
-        preview_grand_total = 0
-        
-        for _, item in edited_items.iterrows():
-            qty = float(item.get('qty', 0))
-            price = float(item.get('price', 0))
-            discount = float(item.get('discount', 0))
-            gst_rate = float(item.get('gst', 0))
-            
-            subtotal = qty * price
-            disc_amount = subtotal * discount / 100
-            taxable = subtotal - disc_amount
-            
-            # Detect tax type from original bill
-            if bill_data['igst'] > 0:
-                igst_amt = (taxable * gst_rate) / 100
-                cgst_amt = 0
-                sgst_amt = 0
-                total = taxable + igst_amt
-            elif bill_data['cgst'] > 0 or bill_data['sgst'] > 0:
-                cgst_amt = (taxable * gst_rate) / 200
-                sgst_amt = (taxable * gst_rate) / 200
-                igst_amt = 0
-                total = taxable + cgst_amt + sgst_amt
-            else:
-                cgst_amt = sgst_amt = igst_amt = 0
-                total = taxable
-            
-            preview_subtotal += taxable
-            preview_cgst += cgst_amt
-            preview_sgst += sgst_amt
-            preview_igst += igst_amt
-            preview_grand_total += total
+        # Keep the bill's tax type
+        amounts, totals = calculate(edited_items, tax_type_of(bill_data))
+        preview_subtotal = totals['taxable']
+        preview_grand_total = totals['total']
         
         col_p1, col_p2, col_p3 = st.columns(3)
         with col_p1:
             st.metric("New Subtotal", f"₹{preview_subtotal:.2f}", delta=f"₹{preview_subtotal - bill_data['subtotal']:.2f}")
         with col_p2:
-            if preview_igst > 0:
-                st.metric("New IGST", f"₹{preview_igst:.2f}")
+            if totals['igst'] > 0:
+                st.metric("New IGST", f"₹{totals['igst']:.2f}")
             else:
-                st.metric("New CGST+SGST", f"₹{(preview_cgst + preview_sgst):.2f}")
+                st.metric("New CGST+SGST", f"₹{(totals['cgst'] + totals['sgst']):.2f}")
         with col_p3:
             st.metric("New Grand Total", f"₹{preview_grand_total:.2f}", delta=f"₹{preview_grand_total - bill_data['grand_total']:.2f}")
         
@@ -601,94 +499,37 @@ def edit_bill_tab(bills, items_df, customers, products, company_df, batches_df,
         
         with col_btn1:
             if st.button("💾 Save Changes & Regenerate PDF", key="save_edit_bill_btn", type="primary"):
-                # Calculate new totals
-                new_subtotal = 0
-                new_cgst = 0
-                new_sgst = 0
-                new_igst = 0
-                new_grand_total = 0
-                
-                updated_items = []
-                
-                for _, item in edited_items.iterrows():
-                    qty = float(item.get('qty', 0))
-                    price = float(item.get('price', 0))
-                    discount = float(item.get('discount', 0))
-                    gst_rate = float(item.get('gst', 0))
-                    
-                    subtotal = qty * price
-                    disc_amount = subtotal * discount / 100
-                    taxable = subtotal - disc_amount
-                    
-                    # Detect tax type from original bill
-                    if bill_data['igst'] > 0:
-                        igst_amt = (taxable * gst_rate) / 100
-                        cgst_amt = 0
-                        sgst_amt = 0
-                        total = taxable + igst_amt
-                    elif bill_data['cgst'] > 0 or bill_data['sgst'] > 0:
-                        cgst_amt = (taxable * gst_rate) / 200
-                        sgst_amt = (taxable * gst_rate) / 200
-                        igst_amt = 0
-                        total = taxable + cgst_amt + sgst_amt
-                    else:
-                        cgst_amt = sgst_amt = igst_amt = 0
-                        total = taxable
-                    
-                    new_subtotal += taxable
-                    new_cgst += cgst_amt
-                    new_sgst += sgst_amt
-                    new_igst += igst_amt
-                    new_grand_total += total
-                    
-                    updated_items.append({
-                        'name': str(item.get('product', '')),
-                        'product': str(item.get('product', '')),
-                        'batch_no': str(item.get('batch_no', '')),
-                        'qty': qty,
-                        'rate': price,
-                        'price': price,
-                        'gst': gst_rate,
-                        'free': int(item.get('free', 0)),
-                        'discount': discount,
-                        'mfg': str(item.get('mfg', '')),
-                        'exp': str(item.get('exp', '')),
-                        'taxable': taxable,
-                        'cgst': cgst_amt,
-                        'sgst': sgst_amt,
-                        'igst': igst_amt,
-                        'total': total
-                    })
-                
-                # Update bills table
-                bills.loc[bills.bill_no == selected_bill_no, 'subtotal'] = new_subtotal
-                bills.loc[bills.bill_no == selected_bill_no, 'cgst'] = new_cgst
-                bills.loc[bills.bill_no == selected_bill_no, 'sgst'] = new_sgst
-                bills.loc[bills.bill_no == selected_bill_no, 'igst'] = new_igst
-                bills.loc[bills.bill_no == selected_bill_no, 'grand_total'] = new_grand_total
-                bills.loc[bills.bill_no == selected_bill_no, 'payment_status'] = new_payment_status
-                
-                save_csv(bills, BILLS_FILE)
+                # Saved with exactly the previewed amounts
+                updated_items = pd.DataFrame({
+                    'name': edited_items['product'],
+                    'product': edited_items['product'],
+                    'batch_no': edited_items['batch_no'],
+                    'qty': edited_items['qty'],
+                    'rate': edited_items['price'],
+                    'price': edited_items['price'],
+                    'gst': edited_items['gst'],
+                    'free': edited_items['free'],
+                    'discount': edited_items['discount'],
+                    'mfg': edited_items['mfg'],
+                    'exp': edited_items['exp'],
+                }).join(amounts).to_dict('records')
                 
-                # Update items
-                items_df = items_df[items_df.bill_no != selected_bill_no]  # Remove old items
-                
-                for item in updated_items:
-                    new_item = {
-                        'bill_no': selected_bill_no,
-                        'product': item['name'],
-                        'qty': item['qty'],
-                        'price': item['price'],
-                        'gst': item['gst'],
-                        'mfg': item['mfg'],
-                        'exp': item['exp'],
-                        'free': item['free'],
-                        'discount': item['discount'],
-                        'batch_no': item['batch_no']
-                    }
-                    items_df = pd.concat([items_df, pd.DataFrame([new_item])], ignore_index=True)
-
-                save_csv(items_df, ITEMS_FILE)
+                # Bill, items and the net stock change of each edited line, saved together
+                bill_values = dict(
+                    subtotal=totals['taxable'], cgst=totals['cgst'], sgst=totals['sgst'], igst=totals['igst'],
+                    grand_total=totals['total'], payment_status=new_payment_status
+                )
+                commit_invoice_edit(repo, selected_bill_no, bill_values, [{
+                    'product': item['name'],
+                    'qty': item['qty'],
+                    'price': item['price'],
+                    'gst': item['gst'],
+                    'mfg': item['mfg'],
+                    'exp': item['exp'],
+                    'free': item['free'],
+                    'discount': item['discount'],
+                    'batch_no': item['batch_no']
+                } for item in updated_items], f"Edit of {selected_bill_no}")
                 
                 # Regenerate PDF
                 customer_dict = customer_info.to_dict()
@@ -696,12 +537,7 @@ def edit_bill_tab(bills, items_df, customers, products, company_df, batches_df,
                 folder_path = get_month_year_folder(bill_data['bill_date'], customer_name)
                 pdf_path = f"{folder_path}/{selected_bill_no.replace('/', '_')}.pdf"
                 
-                # Detect tax type
-                tax_type = "GST"
-                if new_igst > 0:
-                    tax_type = "IGST"
-                elif new_cgst == 0 and new_sgst == 0:
-                    tax_type = "NO_TAX"
+                tax_type = tax_type_of(totals)
                 
                 company_dict = {
                     'name': str(company_df.loc[0]['name']),
@@ -715,7 +551,7 @@ def edit_bill_tab(bills, items_df, customers, products, company_df, batches_df,
                 
                 invoice_dict = {
                     'number': selected_bill_no,
-                    'date': str(bill_data['bill_date']),
+                    'date': format_date(bill_data['bill_date']),
                     'terms': "Goods once sold will not be taken back. E. & O.E."
                 }
                 
@@ -729,7 +565,12 @@ def edit_bill_tab(bills, items_df, customers, products, company_df, batches_df,
         
         with col_btn2:
             if st.button("🔄 Recalculate Stock", key="recalc_stock_btn"):
-                st.info("💡 Stock will be automatically adjusted based on the changes when you save.")
+                stock_changes = item_changes(repo, bill_items_data, edited_items)
+                if stock_changes.empty:
+                    st.info("💡 No stock changes: the items sold are the same as before.")
+                else:
+                    st.info("💡 Saving will adjust stock by these net quantities (negative goes back into stock):")
+                    st.dataframe(stock_changes.drop(columns='product_id'), width='stretch', hide_index=True)
         
         with col_btn3:
             folder_path = get_month_year_folder(bill_data['bill_date'], customer_info['name'])
@@ -746,7 +587,5 @@ def edit_bill_tab(bills, items_df, customers, products, company_df, batches_df,
                     mime="application/pdf",
                     key="edit_download_pdf"
                 )
-    
-    return bills, items_df, products, batches_df, stock_movements_df
 
 
@@ -3,7 +3,8 @@ import streamlit as st
 import pandas as pd
 from data_utils import safe_str
 
-def company_tab(company_df):
+def company_tab(repo):
+    company_df = repo['company.csv']
     st.header("🏢 Company Details")
     
     with st.form("company_form"):
@@ -26,8 +27,7 @@ def company_tab(company_df):
             company_df.loc[0, 'fssai'] = fssai
             company_df.loc[0, 'phone'] = phone
             company_df.loc[0, 'address'] = address
+            repo.save()
             
             st.success("✅ Company details saved!")
             st.rerun()
-    
-    return company_df
@@ -1,8 +1,9 @@
 # ui_customers.py
 import streamlit as st
-import pandas as pd
+from data_utils import new_ids
 
-def customers_tab(customers):
+def customers_tab(repo):
+    customers = repo['customers.csv']
     st.header("👥 Manage Customers")
     
     tab1, tab2 = st.tabs(["Add Customer", "View Customers"])
@@ -28,7 +29,7 @@ def customers_tab(customers):
             
             if st.form_submit_button("Add Customer", type="primary"):
                 if name:
-                    new_id = 1 if customers.empty else int(customers['id'].max()) + 1
+                    new_id = new_ids(customers, 'customers.csv')
                     
                     new_customer = {
                         'id': new_id,
@@ -43,7 +44,8 @@ def customers_tab(customers):
                         'ship_gstin': ship_gstin
                     }
                     
-                    customers = pd.concat([customers, pd.DataFrame([new_customer])], ignore_index=True)
+                    repo.insert('customers.csv', new_customer)
+                    repo.save()
                     st.success(f"✅ Customer '{name}' added successfully!")
                     st.rerun()
                 else:
@@ -59,11 +61,10 @@ def customers_tab(customers):
             
             with st.expander("Delete Customer"):
                 del_id = st.selectbox("Select customer to delete", customers['id'].tolist(),
-                                     format_func=lambda x: customers[customers.id==x].iloc[0]['name'])
+                                     format_func=lambda x: repo.get('customers.csv', 'id', x)['name'])
                 
                 if st.button("🗑️ Delete Customer", type="secondary"):
-                    customers = customers[customers.id != del_id]
+                    repo.delete('customers.csv', 'id', del_id)
+                    repo.save()
                     st.success("Customer deleted!")
                     st.rerun()
-    
-    return customers
@@ -1,8 +1,9 @@
 # ui_products.py
 import streamlit as st
-import pandas as pd
+from data_utils import new_ids
 
-def products_tab(products):
+def products_tab(repo):
+    products = repo['products.csv']
     st.header("📦 Manage Products")
     
     tab1, tab2 = st.tabs(["Add Product", "View Products"])
@@ -30,7 +31,7 @@ def products_tab(products):
             
             if st.form_submit_button("Add Product", type="primary"):
                 if name:
-                    new_id = 1 if products.empty else int(products['id'].max()) + 1
+                    new_id = new_ids(products, 'products.csv')
                     
                     new_product = {
                         'id': new_id,
@@ -45,7 +46,8 @@ def products_tab(products):
                         'discount': discount
                     }
                     
-                    products = pd.concat([products, pd.DataFrame([new_product])], ignore_index=True)
+                    repo.insert('products.csv', new_product)
+                    repo.save()
                     st.success(f"✅ Product '{name}' added successfully!")
                     st.rerun()
                 else:
@@ -61,12 +63,11 @@ def products_tab(products):
             
             with st.expander("Delete Product"):
                 del_id = st.selectbox("Select product to delete", products['id'].tolist(),
-                                     format_func=lambda x: products[products.id==x].iloc[0]['name'])
+                                     format_func=lambda x: repo.get('products.csv', 'id', x)['name'])
                 
                 if st.button("🗑️ Delete Product", type="secondary"):
-                    products = products[products.id != del_id]
+                    repo.delete('products.csv', 'id', del_id)
+                    repo.save()
                     st.success("Product deleted!")
                     st.rerun()
     
-    return products
-    
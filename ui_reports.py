@@ -3,22 +3,30 @@ import streamlit as st
 import pandas as pd
 import os
 from datetime import datetime
-from data_utils import get_month_year_folder
+from data_utils import (
+    get_month_year_folder, find_rows, financial_year, financial_years,
+    with_history, format_date, audit_invoice_numbers
+)
 
-def reports_tab(bills, items_df, customers):
+def reports_tab(repo):
+    bills = repo['bills.csv']
+    customers = repo['customers.csv']
     st.header("📊 Sales Reports & Ledger")
     
     report_tabs = st.tabs(["Sales Summary", "Customer Ledger"])
     
+    # Bills of earlier financial years are only loaded when a filter asks for them
+    years = financial_years()
+    
     # Sales Summary
     with report_tabs[0]:
-        if bills.empty:
+        if bills.empty and len(years) == 1:
             st.info("No bills generated yet.")
         else:
             col1, col2, col3 = st.columns(3)
             
             with col1:
-                filter_fy = st.selectbox("Financial Year", ["All"] + list(bills.fy.unique()), key="filter_fy_select")
+                filter_fy = st.selectbox("Financial Year", ["All"] + years, index=1, key="filter_fy_select")
             
             with col2:
                 filter_status = st.selectbox("Payment Status", ["All", "Paid", "Pending", "Partially Paid"], key="filter_status_select")
@@ -30,16 +38,20 @@ def reports_tab(bills, items_df, customers):
                     key="filter_customer_select"
                 )
             
-            filtered_bills = bills.copy()
+            if filter_fy == financial_year():
+                filtered_bills = bills.copy()
+            else:
+                filtered_bills = with_history(bills, 'bills.csv', years if filter_fy == "All" else [filter_fy])
             
             if filter_fy != "All":
                 filtered_bills = filtered_bills[filtered_bills.fy == filter_fy]
+                fy_bills = filtered_bills
             
             if filter_status != "All":
                 filtered_bills = filtered_bills[filtered_bills.payment_status == filter_status]
             
             if filter_customer != "All":
-                cust_id_filter = customers[customers.name == filter_customer].iloc[0]['id']
+                cust_id_filter = repo.get('customers.csv', 'name', filter_customer)['id']
                 filtered_bills = filtered_bills[filtered_bills.customer_id == cust_id_filter]
             
             st.subheader("Summary")
@@ -62,6 +74,17 @@ def reports_tab(bills, items_df, customers):
                 pending_amount = pending_bills['grand_total'].sum()
                 st.metric("Pending Amount", f"₹{pending_amount:,.2f}")
             
+            if filter_fy != "All":
+                with st.expander("🔢 Invoice Number Audit"):
+                    gaps, duplicates = audit_invoice_numbers(fy_bills, filter_fy)
+                    if not gaps and not duplicates:
+                        st.success("No skipped or duplicate invoice numbers.")
+                    if gaps:
+                        shown = ", ".join(str(number) for number in gaps[:50])
+                        st.warning(f"Numbers skipped: {shown}{' …' if len(gaps) > 50 else ''}")
+                    if duplicates:
+                        st.error(f"Used by more than one bill: {', '.join(duplicates)}")
+            
             st.divider()
             
             st.subheader("Bills List")
@@ -92,7 +115,7 @@ def reports_tab(bills, items_df, customers):
     with report_tabs[1]:
         st.subheader("Customer-wise Ledger")
         
-        if customers.empty or bills.empty:
+        if customers.empty or (bills.empty and len(years) == 1):
             st.info("No customer transactions available.")
         else:
             selected_customer = st.selectbox(
@@ -100,10 +123,19 @@ def reports_tab(bills, items_df, customers):
                 customers.name.tolist(),
                 key="ledger_customer_select"
             )
+            all_years = st.checkbox(
+                "Include earlier financial years",
+                key="ledger_all_years",
+                disabled=len(years) == 1
+            )
             
             if selected_customer:
-                cust_id_ledger = customers[customers.name == selected_customer].iloc[0]['id']
-                customer_bills = bills[bills.customer_id == cust_id_ledger].copy()
+                cust_id_ledger = repo.get('customers.csv', 'name', selected_customer)['id']
+                if all_years:
+                    ledger_bills = with_history(bills, 'bills.csv', years)
+                    customer_bills = find_rows(ledger_bills, 'bills.csv', 'customer_id', cust_id_ledger).copy()
+                else:
+                    customer_bills = repo.find('bills.csv', 'customer_id', cust_id_ledger).copy()
                 
                 if not customer_bills.empty:
                     total_invoices = len(customer_bills)
@@ -139,7 +171,7 @@ def reports_tab(bills, items_df, customers):
                     )
                     
                     st.subheader("Customer Bill Files")
-                    customer_obj = customers[customers.id == cust_id_ledger].iloc[0]
+                    customer_obj = repo.get('customers.csv', 'id', cust_id_ledger)
                     
                     # FIXED: Use enumerate to create unique keys
                     for idx, (bill_idx, bill) in enumerate(customer_bills.iterrows()):
@@ -153,7 +185,7 @@ def reports_tab(bills, items_df, customers):
                             col_info, col_btn = st.columns([3, 1])
                             with col_info:
                                 status_badge = "🟢" if bill['payment_status'] == "Paid" else "🔴" if bill['payment_status'] == "Pending" else "🟠"
-                                st.write(f"{status_badge} {bill['bill_no']} - {bill['bill_date']} - ₹{bill['grand_total']:.2f}")
+                                st.write(f"{status_badge} {bill['bill_no']} - {format_date(bill['bill_date'])} - ₹{bill['grand_total']:.2f}")
                             with col_btn:
                                 # Use unique key with index
                                 st.download_button(
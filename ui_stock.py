@@ -1,10 +1,12 @@
 # ui_stock.py
 import streamlit as st
-import pandas as pd
 from datetime import date
-from data_utils import record_stock_movement
+from data_utils import StockMovements, new_ids
 
-def stock_management_tab(products, batches_df, stock_movements_df):
+def stock_management_tab(repo):
+    products = repo['products.csv']
+    batches_df = repo['batches.csv']
+    stock_movements_df = repo['stock_movements.csv']
     st.header("📦 Stock & Batch Management")
     
     stock_tabs = st.tabs(["Stock Overview", "Batch Management", "Stock Adjustments", "Stock Movements"])
@@ -50,7 +52,7 @@ def stock_management_tab(products, batches_df, stock_movements_df):
                     product_id = st.selectbox(
                         "Select Product",
                         products['id'].tolist(),
-                        format_func=lambda x: products[products.id == x].iloc[0]['name'],
+                        format_func=lambda x: repo.get('products.csv', 'id', x)['name'],
                         key="batch_product_select"
                     )
                     batch_no = st.text_input("Batch Number", key="batch_no_input")
@@ -63,7 +65,7 @@ def stock_management_tab(products, batches_df, stock_movements_df):
                 
                 if st.button("Add Batch", key="add_batch_btn"):
                     if batch_no and quantity > 0:
-                        new_batch_id = 1 if batches_df.empty else int(batches_df['id'].max()) + 1
+                        new_batch_id = new_ids(batches_df, 'batches.csv')
                         
                         new_batch = {
                             'id': new_batch_id,
@@ -75,14 +77,15 @@ def stock_management_tab(products, batches_df, stock_movements_df):
                             'price': price
                         }
                         
-                        batches_df = pd.concat([batches_df, pd.DataFrame([new_batch])], ignore_index=True)
+                        repo.insert('batches.csv', new_batch)
                         
-                        products.loc[products.id == product_id, 'stock'] = products.loc[products.id == product_id, 'stock'] + quantity
+                        current_stock = repo.get('products.csv', 'id', product_id)['stock']
+                        repo.update('products.csv', 'id', product_id, stock=current_stock + quantity)
                         
-                        stock_movements_df = record_stock_movement(
-                            stock_movements_df, product_id, batch_no, "IN", quantity, 
-                            f"Batch {batch_no}", "New batch added"
-                        )
+                        movements = StockMovements(repo)
+                        movements.add(product_id, batch_no, "IN", quantity, f"Batch {batch_no}", "New batch added")
+                        movements.record()
+                        repo.save()
                         
                         st.success(f"✅ Batch {batch_no} added successfully!")
                         st.rerun()
@@ -116,7 +119,7 @@ def stock_management_tab(products, batches_df, stock_movements_df):
                 adjust_product_id = st.selectbox(
                     "Select Product to Adjust",
                     products['id'].tolist(),
-                    format_func=lambda x: f"{products[products.id == x].iloc[0]['name']} (Current: {products[products.id == x].iloc[0]['stock']})",
+                    format_func=lambda x: f"{repo.get('products.csv', 'id', x)['name']} (Current: {repo.get('products.csv', 'id', x)['stock']})",
                     key="adjust_product_select"
                 )
             
@@ -139,25 +142,25 @@ def stock_management_tab(products, batches_df, stock_movements_df):
                 adjustment_reason = st.text_area("Reason/Notes", key="adjustment_reason")
             
             if st.button("Apply Adjustment", key="apply_adjustment_btn", type="primary"):
-                current_stock = products[products.id == adjust_product_id].iloc[0]['stock']
+                current_stock = repo.get('products.csv', 'id', adjust_product_id)['stock']
                 
                 if adjustment_type == "Add Stock":
-                    products.loc[products.id == adjust_product_id, 'stock'] = current_stock + adjustment_qty
+                    repo.update('products.csv', 'id', adjust_product_id, stock=current_stock + adjustment_qty)
                     movement_type = "ADJUST_IN"
                     qty_change = adjustment_qty
                 elif adjustment_type == "Remove Stock":
-                    products.loc[products.id == adjust_product_id, 'stock'] = max(0, current_stock - adjustment_qty)
+                    repo.update('products.csv', 'id', adjust_product_id, stock=max(0, current_stock - adjustment_qty))
                     movement_type = "ADJUST_OUT"
                     qty_change = -adjustment_qty
                 else:
-                    products.loc[products.id == adjust_product_id, 'stock'] = new_stock
+                    repo.update('products.csv', 'id', adjust_product_id, stock=new_stock)
                     movement_type = "ADJUST_SET"
                     qty_change = new_stock - current_stock
                 
-                stock_movements_df = record_stock_movement(
-                    stock_movements_df, adjust_product_id, "MANUAL", movement_type, 
-                    qty_change, "Manual Adjustment", adjustment_reason
-                )
+                movements = StockMovements(repo)
+                movements.add(adjust_product_id, "MANUAL", movement_type, qty_change, "Manual Adjustment", adjustment_reason)
+                movements.record()
+                repo.save()
                 
                 st.success("✅ Stock adjusted successfully!")
                 st.rerun()
@@ -200,7 +203,7 @@ def stock_management_tab(products, batches_df, stock_movements_df):
                 filtered_movements = filtered_movements[filtered_movements['movement_type'] == filter_type]
             
             if filter_product != "All":
-                prod_id = products[products.name == filter_product].iloc[0]['id']
+                prod_id = repo.get('products.csv', 'name', filter_product)['id']
                 filtered_movements = filtered_movements[filtered_movements['product_id'] == prod_id]
             
             display_cols = ['date', 'name', 'batch_no', 'movement_type', 'quantity', 'reference', 'notes']
@@ -214,5 +217,3 @@ def stock_management_tab(products, batches_df, stock_movements_df):
                 mime="text/csv",
                 key="export_movements_btn"
             )
-    
-    return products, batches_df, stock_movements_df
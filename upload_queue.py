@@ -0,0 +1,109 @@
+# upload_queue.py - write-behind queue for Drive uploads
+import threading
+import time
+
+
+class UploadQueue:
+    """Uploads files on a background thread, coalescing repeated writes of the same file"""
+
+    def __init__(self, upload, max_attempts=3, retry_delay=2, retryable=lambda error: True):
+        # upload(filename, payload) must raise on failure; only errors
+        # retryable(error) accepts are tried again
+        self._upload = upload
+        self._retryable = retryable
+        self._max_attempts = max_attempts
+        self._retry_delay = retry_delay
+        self._cond = threading.Condition()
+        self._pending = {}     # filename -> (frame, payload), latest write wins
+        self._in_flight = None  # (filename, (frame, payload))
+        self._failed = {}      # filename -> (frame, payload, error)
+        self._worker = None
+        self.completed = 0
+
+    def enqueue(self, filename, frame, payload):
+        """Queue a file for upload, replacing any not yet started upload of it"""
+        with self._cond:
+            # Re-queued at the back: files queued before it (a journal entry) still go first
+            self._pending.pop(filename, None)
+            self._pending[filename] = (frame, payload)
+            self._failed.pop(filename, None)
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="drive-upload", daemon=True)
+                self._worker.start()
+
+    def cancel(self, filename):
+        """Drop a queued or failed upload; one already in flight still completes"""
+        with self._cond:
+            self._pending.pop(filename, None)
+            self._failed.pop(filename, None)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._pending:
+                    self._worker = None
+                    self._cond.notify_all()
+                    return
+                filename = next(iter(self._pending))
+                entry = self._pending.pop(filename)
+                self._in_flight = (filename, entry)
+
+            error = None
+            for attempt in range(self._max_attempts):
+                try:
+                    self._upload(filename, entry[1])
+                    error = None
+                    break
+                except Exception as e:
+                    error = e
+                    if not self._retryable(e):
+                        break
+                    if attempt < self._max_attempts - 1:
+                        time.sleep(self._retry_delay * 2 ** attempt)
+
+            with self._cond:
+                self._in_flight = None
+                if error is None:
+                    self.completed += 1
+                elif filename not in self._pending:
+                    # A newer write supersedes the failed one
+                    self._failed[filename] = (entry[0], entry[1], str(error))
+                self._cond.notify_all()
+
+    def latest_frame(self, filename):
+        """Get the newest frame not yet confirmed on Drive, or None"""
+        with self._cond:
+            if filename in self._pending:
+                return self._pending[filename][0]
+            if self._in_flight and self._in_flight[0] == filename:
+                return self._in_flight[1][0]
+            if filename in self._failed:
+                return self._failed[filename][0]
+            return None
+
+    def status(self):
+        """Get pending filenames and failed filenames with their errors"""
+        with self._cond:
+            pending = list(self._pending)
+            if self._in_flight:
+                pending.insert(0, self._in_flight[0])
+            failed = {filename: entry[2] for filename, entry in self._failed.items()}
+            return {'pending': pending, 'failed': failed}
+
+    def retry_failed(self):
+        """Re-queue every failed upload"""
+        with self._cond:
+            failed, self._failed = self._failed, {}
+        for filename, (frame, payload, _) in failed.items():
+            self.enqueue(filename, frame, payload)
+
+    def flush(self, timeout=None):
+        """Wait for queued uploads to finish; True if nothing is pending or failed"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._pending or self._in_flight:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return not self._failed